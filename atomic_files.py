@@ -0,0 +1,30 @@
+"""Atomic file writes and lock-protected JSON tables shared by the caches, pools and leases"""
+
+import contextlib
+import fcntl
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable
+
+
+def write_atomic(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def locked_json(path: Path, default: Callable[[], Any] = dict):
+    # Holds an exclusive lock while the caller edits the table, then writes it back atomically;
+    # an unreadable file (e.g. truncated by a crash before writes were atomic) starts over empty
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            table = json.loads(path.read_text()) if path.exists() else default()
+        except ValueError:
+            table = default()
+        yield table
+        write_atomic(path, json.dumps(table, indent=2, sort_keys=True) + "\n")
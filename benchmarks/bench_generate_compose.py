@@ -0,0 +1,228 @@
+"""Benchmark generate_compose.py against synthetic scenarios of growing size"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import generate_compose  # noqa: E402
+
+
+HISTORY_PATH = Path(__file__).resolve().parent / "history.jsonl"
+
+DEFAULT_SIZES = [2, 100, 1000, 10000]
+DEFAULT_ENV_VARS = 50
+DEFAULT_REPEAT = 5
+
+# A case is flagged when it is this much slower than its median over the last HISTORY_WINDOW runs, both
+# in wall time and relative to a fixed calibration workload, so neither a slower or busier machine nor a
+# noisy calibration alone counts
+REGRESSION_THRESHOLD = 1.25
+HISTORY_WINDOW = 5
+# A median of fewer runs than this is not a baseline yet
+HISTORY_MIN_RUNS = 3
+
+# Cases faster than this per call are timer noise and are never flagged
+NOISE_FLOOR_SECONDS = 0.0001
+
+
+def synthesize_scenario(participant_count: int, env_vars: int) -> dict[str, Any]:
+    def env(prefix: str) -> dict[str, str]:
+        env_map = {f"{prefix}_VAR_{i}": f"value-{i}" for i in range(env_vars)}
+        env_map[f"{prefix}_API_KEY"] = f"${{{prefix}_API_KEY}}"
+        return env_map
+
+    participants = []
+    for i in range(participant_count):
+        participants.append({
+            "agentbeats_id": f"00000000-0000-7000-8000-{i:012d}",
+            "name": f"red_{i}",
+            "image": f"ghcr.io/example/red-agent-{i % 10}:latest",
+            "env": env(f"RED_{i}"),
+        })
+
+    return {
+        "green_agent": {"image": "ghcr.io/example/green-agent:latest", "env": env("GREEN")},
+        "participants": participants,
+        "config": {
+            "vm_command": ["qemu-system-x86_64", "-nographic", "-m", "1G", "-smp", "cpus=4"],
+            "timeout_sec_after_ssh_up": 120,
+            "vm_credentials": {p["name"]: f"SSH, port 9032, username {p['name']}" for p in participants},
+        },
+    }
+
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    # autorange loops fast functions until a batch takes at least 0.2s; the best batch is kept
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def measure(func: Callable[[], Any], repeat: int) -> tuple[float, int]:
+    seconds = best_time(func, repeat)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak
+
+
+def calibration_workload():
+    # String formatting and dict building, like the generators, but independent of their code
+    lines = {f"KEY_{i}": f"value-{i}" for i in range(2000)}
+    return "".join(f"      - {key}={value}\n" for key, value in sorted(lines.items()))
+
+
+def bench_size(participant_count: int, env_vars: int, repeat: int, workdir: Path,
+               functions: set[str] | None = None) -> list[dict[str, Any]]:
+    import tomli_w
+
+    scenario = synthesize_scenario(participant_count, env_vars)
+    scenario_path = workdir / f"scenario-{participant_count}.toml"
+    scenario_path.write_text(tomli_w.dumps(scenario))
+
+    green_env = scenario["green_agent"]["env"]
+    names = [p["name"] for p in scenario["participants"]]
+
+    def write_compose():
+        with open(os.devnull, "w") as f:
+            generate_compose.write_docker_compose(scenario, f)
+
+    cases = {
+        "parse_scenario": lambda: generate_compose.parse_scenario(scenario_path),
+        "generate_docker_compose": lambda: generate_compose.generate_docker_compose(scenario),
+        "write_docker_compose": write_compose,
+        "generate_a2a_scenario": lambda: generate_compose.generate_a2a_scenario(scenario),
+        "generate_env_file": lambda: generate_compose.generate_env_file(scenario),
+        "format_env_vars": lambda: generate_compose.format_env_vars(green_env),
+        "format_depends_on": lambda: generate_compose.format_depends_on(names),
+    }
+
+    records = []
+    for function, case in cases.items():
+        if functions is not None and function not in functions:
+            continue
+        # Calibrating right before each case keeps machine speed drift during the run out of the ratio
+        calibration = best_time(calibration_workload, repeat)
+        seconds, peak = measure(case, repeat)
+        records.append({
+            "function": function,
+            "participants": participant_count,
+            "env_vars": env_vars,
+            "seconds": seconds,
+            "calibration_seconds": calibration,
+            "peak_bytes": peak,
+        })
+    return records
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_recent_runs(history_path: Path, count: int = HISTORY_WINDOW) -> list[dict[str, Any]]:
+    if not history_path.exists():
+        return []
+    lines = history_path.read_text().splitlines()
+    return [json.loads(line) for line in lines[-count:]]
+
+
+def case_key(record: dict[str, Any]) -> tuple[str, int, int]:
+    return record["function"], record["participants"], record["env_vars"]
+
+
+def find_regressions(previous: list[dict[str, Any]], records: list[dict[str, Any]]) -> list[tuple[dict[str, Any], float]]:
+    # The median keeps one noisy or regressed run from becoming the whole baseline
+    samples = {}
+    for run in previous:
+        for r in run["results"]:
+            if "calibration_seconds" in r:
+                samples.setdefault(case_key(r), []).append((r["seconds"], r["seconds"] / r["calibration_seconds"]))
+    baseline = {
+        key: (statistics.median(s for s, _ in pairs), statistics.median(ratio for _, ratio in pairs))
+        for key, pairs in samples.items() if len(pairs) >= HISTORY_MIN_RUNS
+    }
+
+    regressions = []
+    for record in records:
+        before, before_ratio = baseline.get(case_key(record), (None, None))
+        if before is None or before < NOISE_FLOOR_SECONDS:
+            continue
+        ratio = record["seconds"] / record["calibration_seconds"]
+        if record["seconds"] > before * REGRESSION_THRESHOLD and ratio > before_ratio * REGRESSION_THRESHOLD:
+            regressions.append((record, before))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_compose.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Participant counts")
+    parser.add_argument("--env-vars", type=int, default=DEFAULT_ENV_VARS, help="Env vars per agent")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed batches per case (best is kept)")
+    parser.add_argument("--history", type=Path, default=HISTORY_PATH)
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the history")
+    args = parser.parse_args()
+
+    history = load_recent_runs(args.history)
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            records.extend(bench_size(size, args.env_vars, args.repeat, Path(tmp)))
+
+        # Measure flagged cases once more and keep the better result, so a burst of load on the machine
+        # during one case is not reported; a real slowdown shows up both times
+        regressions = find_regressions(history, records)
+        positions = {case_key(record): i for i, record in enumerate(records)}
+        for size in sorted({record["participants"] for record, _ in regressions}):
+            functions = {record["function"] for record, _ in regressions if record["participants"] == size}
+            for retry in bench_size(size, args.env_vars, args.repeat, Path(tmp), functions):
+                first = records[positions[case_key(retry)]]
+                if retry["seconds"] / retry["calibration_seconds"] < first["seconds"] / first["calibration_seconds"]:
+                    records[positions[case_key(retry)]] = retry
+
+    print(f"{'function':<26}{'participants':>14}{'time':>14}{'peak mem':>14}")
+    for record in records:
+        print(f"{record['function']:<26}{record['participants']:>14}"
+              f"{record['seconds'] * 1000:>12.3f}ms{record['peak_bytes'] / 1024:>12.0f}KB")
+
+    regressions = find_regressions(history, records)
+    for record, before in regressions:
+        print(f"Regression: {record['function']} ({record['participants']} participants): "
+              f"{before * 1000:.3f}ms -> {record['seconds'] * 1000:.3f}ms")
+
+    if not args.no_save:
+        run = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "results": records,
+        }
+        with open(args.history, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,73 @@
 """Generate Docker Compose configuration from scenario.toml"""
 
-import argparse
+# Imported first so --timings can separate interpreter startup from module import
+import time
+
+STARTUP_CPU_SECONDS = time.process_time()
+IMPORT_START = time.perf_counter()
+
+import hashlib
+import itertools
+import json
+import math
+import os
 import re
 import sys
 from pathlib import Path
-from typing import Any
-
-try:
-    import tomli
-except ImportError:
-    try:
-        import tomllib as tomli
-    except ImportError:
-        print("Error: tomli required. Install with: pip install tomli")
-        sys.exit(1)
-try:
-    import tomli_w
-except ImportError:
-    print("Error: tomli-w required. Install with: pip install tomli-w")
-    sys.exit(1)
+from typing import Any, Iterator, TextIO
 
 
 COMPOSE_PATH = "docker-compose.yml"
 A2A_SCENARIO_PATH = "a2a-scenario.toml"
 ENV_PATH = ".env.example"
+CACHE_PATH = ".generate_compose.cache.json"
+
+# Bump whenever the templates or generators change their output
+GENERATOR_VERSION = "1"
 
 DEFAULT_PORT = 9009
 
-COMPOSE_TEMPLATE = """# Auto-generated from scenario.toml
+CLIENT_IMAGE = "ghcr.io/komyo-ai/agentbeats-client:v1.0.0"
+AGENT_PLATFORM = "linux/amd64"
+MAX_PULL_CONCURRENCY = 4
+
+# Resource planning: the green agent runs the QEMU VM from [config].vm_command plus its own process
+GREEN_OVERHEAD_CPUS = 1
+GREEN_OVERHEAD_MEMORY_MIB = 512
+DEFAULT_VM_CPUS = 1
+DEFAULT_VM_MEMORY_MIB = 128
+DEFAULT_PARTICIPANT_RESOURCES = {"cpus": 1, "memory_mib": 1024}
+CLIENT_RESOURCES = {"cpus": 0.5, "memory_mib": 256}
+
+SIZE_UNITS_MIB = {"k": 1 / 1024, "m": 1, "g": 1024, "t": 1024 * 1024}
+
+DEFAULT_HEALTHCHECK = {"interval": "5s", "timeout": "3s", "retries": 10, "start_period": "30s"}
 
+COMPOSE_TEMPLATE = """# Auto-generated from scenario.toml
+{project_name}
 services:
   green-agent:
     image: {green_image}
     platform: linux/amd64
-    container_name: green-agent
-    command: ["--host", "0.0.0.0", "--port", "{green_port}", "--card-url", "http://green-agent:{green_port}"]
+    container_name: {container_prefix}green-agent
+{green_resources}{green_volumes}    command: ["--host", "0.0.0.0", "--port", "{green_port}", "--card-url", "http://green-agent:{green_port}"]
     environment:{green_env}
     healthcheck:
       test: ["CMD", "curl", "-f", "http://localhost:{green_port}/.well-known/agent-card.json"]
-      interval: 5s
-      timeout: 3s
-      retries: 10
-      start_period: 30s
+      interval: {green_interval}
+      timeout: {green_timeout}
+      retries: {green_retries}
+      start_period: {green_start_period}
     depends_on:{green_depends}
     networks:
       - agent-network
 
 {participant_services}
   agentbeats-client:
-    image: ghcr.io/komyo-ai/agentbeats-client:v1.0.0
+    image: {client_image}
     platform: linux/amd64
-    container_name: agentbeats-client
-    volumes:
+    container_name: {container_prefix}agentbeats-client
+{client_resources}    volumes:
       - ./a2a-scenario.toml:/app/scenario.toml
       - ./output:/app/output
     command: ["scenario.toml", "output/results.json"]
@@ -62,24 +78,158 @@ services:
 networks:
   agent-network:
     driver: bridge
-"""
+{network_name}"""
 
 PARTICIPANT_TEMPLATE = """  {name}:
     image: {image}
     platform: linux/amd64
-    container_name: {name}
-    command: ["--host", "0.0.0.0", "--port", "{port}", "--card-url", "http://{name}:{port}"]
+    container_name: {container_prefix}{name}
+{resources}    command: ["--host", "0.0.0.0", "--port", "{port}", "--card-url", "http://{name}:{port}"]
     environment:{env}
     healthcheck:
       test: ["CMD", "curl", "-f", "http://localhost:{port}/.well-known/agent-card.json"]
-      interval: 5s
-      timeout: 3s
-      retries: 10
-      start_period: 30s
+      interval: {interval}
+      timeout: {timeout}
+      retries: {retries}
+      start_period: {start_period}
+    networks:
+      - agent-network
+"""
+
+# --profile/--profile-memory report this many entries per section
+PROFILE_TOP = 40
+PROFILE_MEMORY_FRAMES = 10
+
+STARTUP_GATE_IMAGE = "curlimages/curl:8.11.0"
+STARTUP_GATE_TIMEOUT = 300
+STARTUP_GATE_POLL_INTERVAL = 0.5
+
+# Used by --startup staged: agents start in parallel and this one-shot service
+# releases the client once the green agent and a quorum of participants answer
+STARTUP_GATE_TEMPLATE = """  startup-gate:
+    image: {gate_image}
+    container_name: {container_prefix}startup-gate
+    entrypoint: ["/bin/sh", "-c"]
+    command:
+      - |
+        probe() {{ curl -sf -o /dev/null --max-time 2 "http://$$1:{port}/.well-known/agent-card.json"; }}
+        pending="{participants}"; ready=0; green=0; end=$$(($$(date +%s) + {timeout}))
+        while :; do
+          [ $$green -eq 1 ] || {{ probe green-agent && green=1; }}
+          still=""
+          for host in $$pending; do
+            if probe $$host; then ready=$$((ready + 1)); else still="$$still $$host"; fi
+          done
+          pending=$$still
+          if [ $$green -eq 1 ] && [ $$ready -ge {quorum} ]; then
+            echo "startup-gate: green-agent and $$ready participant(s) ready"; exit 0
+          fi
+          if [ $$(date +%s) -ge $$end ]; then
+            echo "startup-gate: timed out waiting for green-agent or:$$pending"; exit 1
+          fi
+          sleep {poll_interval}
+        done
     networks:
       - agent-network
 """
 
+STARTUP_MODES = ("healthy", "staged")
+
+# COMPOSE_TEMPLATE cut around its per-participant placeholders so it can be streamed
+(COMPOSE_HEAD, COMPOSE_AFTER_GREEN_DEPENDS, COMPOSE_AFTER_PARTICIPANTS, COMPOSE_TAIL) = (
+    COMPOSE_TEMPLATE
+    .replace("{green_depends}", "\0")
+    .replace("{participant_services}", "\0")
+    .replace("{client_depends}", "\0")
+    .split("\0")
+)
+
+# Host side of QEMU user-mode forwards, e.g. hostfwd=tcp:0.0.0.0:9032-:22
+HOSTFWD_PATTERN = re.compile(r'(hostfwd=(?:tcp|udp):[^:,]*:)(\d+)(-)')
+# Port mentions in free-form config text such as vm_credentials
+CONFIG_PORT_PATTERN = re.compile(r'(\bport\s+)(\d+)()\b')
+
+# ${VAR} references, as docker compose substitutes them
+SECRET_REFERENCE_PATTERN = re.compile(r'\$\{([^}]+)\}')
+# Agent env variable names that should never carry a plain value, matched on whole
+# name segments: OPENAI_API_KEY, ACCESS_TOKEN, DB_PASSWORD, GCP_CREDENTIALS, but
+# not MAX_TOKENS, KEYBOARD or TOKENIZER
+SECRET_NAME_PATTERN = re.compile(r'(?i)(^|_)(API_)?(KEY|TOKEN|SECRET|PASSWORD|PASSWD|CREDENTIALS?)$')
+# Tables whose "env" is passed to a container: green_agent and each participant
+ENV_PARENT_PATTERN = re.compile(r'^(green_agent|participants\[\d+\])$')
+
+# Participant names become compose service names and in-network hostnames, so they must not
+# collide with the services the generator adds itself (hostnames ignore case)
+AGENT_NAME_PATTERN = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$')
+RESERVED_SERVICE_NAMES = frozenset({"green-agent", "agentbeats-client", "startup-gate"})
+UUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+# bool is an int subclass, so "integer" and "number" reject it explicitly
+SCHEMA_TYPES = {
+    "table": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "scalar": (str, int, float, bool),
+    "size": (str, int),
+}
+
+AGENT_ENV_SCHEMA = {"type": "table", "values": {"type": "scalar"}}
+AGENT_RESOURCES_SCHEMA = {
+    "type": "table",
+    "fields": {
+        "cpus": {"type": "number", "minimum": 0.01},
+        "memory": {"type": "size"},
+    },
+}
+
+# [config] is free-form for the green agent; only the keys the tooling reads are checked
+SCENARIO_SCHEMA = {
+    "type": "table",
+    "fields": {
+        "green_agent": {
+            "type": "table",
+            "required": True,
+            "fields": {
+                "image": {"type": "string", "required": True, "non_empty": True},
+                "agentbeats_id": {"type": "string"},
+                "env": AGENT_ENV_SCHEMA,
+                "resources": AGENT_RESOURCES_SCHEMA,
+            },
+        },
+        "participants": {
+            "type": "array",
+            "unique": ("name",),
+            "items": {
+                "type": "table",
+                "fields": {
+                    "name": {"type": "string", "required": True, "pattern": (AGENT_NAME_PATTERN, "agent name"),
+                             "reserved": RESERVED_SERVICE_NAMES},
+                    "agentbeats_id": {"type": "string", "required": True, "pattern": (UUID_PATTERN, "UUID")},
+                    "image": {"type": "string", "required": True, "non_empty": True},
+                    "env": AGENT_ENV_SCHEMA,
+                    "resources": AGENT_RESOURCES_SCHEMA,
+                },
+            },
+        },
+        "config": {
+            "type": "table",
+            "extra": True,
+            "fields": {
+                "vm_command": {"type": "array", "items": {"type": "scalar"}},
+                "vm_hint": {"type": "string"},
+                "timeout_sec_after_ssh_up": {"type": "number", "minimum": 0},
+                "vm_credentials": {"type": "table", "values": {"type": "string"}},
+            },
+        },
+    },
+}
+
+# Run IDs become compose project names and container name prefixes
+RUN_ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+
 A2A_SCENARIO_TEMPLATE = """[green_agent]
 endpoint = "http://green-agent:{green_port}"
 
@@ -87,19 +237,156 @@ endpoint = "http://green-agent:{green_port}"
 {config}"""
 
 
+def load_tomli():
+    try:
+        import tomli
+    except ImportError:
+        try:
+            import tomllib as tomli
+        except ImportError:
+            raise ImportError("tomli required. Install with: pip install tomli") from None
+    return tomli
+
+
+def load_tomli_w():
+    try:
+        import tomli_w
+    except ImportError:
+        raise ImportError("tomli-w required. Install with: pip install tomli-w") from None
+    return tomli_w
+
+
 def parse_scenario(scenario_path: Path) -> dict[str, Any]:
+    tomli = load_tomli()
     toml_data = scenario_path.read_text()
     data = tomli.loads(toml_data)
 
+    # Deliberately lenient: the scenario.toml template leaves IDs and images empty.
+    # --validate applies the full SCENARIO_SCHEMA
     participants = data.get("participants", [])
-    for participant in participants:
-        if "agentbeats_id" not in participant:
-            print(f"Error: Participant '{participant.get('name', 'unknown')}' is missing 'agentbeats_id' field")
-            sys.exit(1)
+    missing = [participant for participant in participants if "agentbeats_id" not in participant]
+    for participant in missing:
+        print(f"Error: Participant '{participant.get('name', 'unknown')}' is missing 'agentbeats_id' field")
+    if missing:
+        sys.exit(1)
+
+    reserved = [p["name"] for p in participants if str(p.get("name", "")).lower() in RESERVED_SERVICE_NAMES]
+    for name in reserved:
+        print(f"Error: Participant name '{name}' is the name of a service the generator adds")
+    if reserved:
+        sys.exit(1)
 
     return data
 
 
+def compile_schema(schema: dict[str, Any]):
+    # Turns a schema into nested closures once, so validating a scenario is a single walk
+    # with no schema interpretation. Validators append "location: message" to errors
+    name = schema["type"]
+    types = SCHEMA_TYPES[name]
+    exclude_bool = bool not in types
+    checks = []
+
+    if schema.get("non_empty"):
+        def check_non_empty(value, location, errors):
+            if not value.strip():
+                errors.append(f"{location}: must not be empty")
+        checks.append(check_non_empty)
+
+    if "pattern" in schema:
+        pattern, description = schema["pattern"]
+
+        def check_pattern(value, location, errors):
+            if not pattern.match(value):
+                errors.append(f"{location}: {value!r} is not a valid {description}")
+        checks.append(check_pattern)
+
+    if "reserved" in schema:
+        reserved = schema["reserved"]
+
+        def check_reserved(value, location, errors):
+            if value.lower() in reserved:
+                errors.append(f"{location}: {value!r} is the name of a service the generator adds")
+        checks.append(check_reserved)
+
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+
+        def check_minimum(value, location, errors):
+            if value < minimum:
+                errors.append(f"{location}: must be at least {minimum}")
+        checks.append(check_minimum)
+
+    if "fields" in schema:
+        fields = {field: compile_schema(spec) for field, spec in schema["fields"].items()}
+        required = [field for field, spec in schema["fields"].items() if spec.get("required")]
+        extra = schema.get("extra", False)
+
+        def check_fields(value, location, errors):
+            prefix = f"{location}." if location else ""
+            for field in required:
+                if field not in value:
+                    errors.append(f"{prefix}{field}: missing required field")
+            for field, item in value.items():
+                validator = fields.get(field)
+                if validator is not None:
+                    validator(item, f"{prefix}{field}", errors)
+                elif not extra:
+                    errors.append(f"{prefix}{field}: unknown field")
+        checks.append(check_fields)
+
+    if "values" in schema:
+        values = compile_schema(schema["values"])
+
+        def check_values(value, location, errors):
+            for key, item in value.items():
+                values(item, f"{location}.{key}", errors)
+        checks.append(check_values)
+
+    if "items" in schema:
+        items = compile_schema(schema["items"])
+
+        def check_items(value, location, errors):
+            for index, item in enumerate(value, start=1):
+                items(item, f"{location}[{index}]", errors)
+        checks.append(check_items)
+
+    if "unique" in schema:
+        unique = schema["unique"]
+
+        def check_unique(value, location, errors):
+            for field in unique:
+                seen = {}
+                for index, item in enumerate(value, start=1):
+                    key = item.get(field) if isinstance(item, dict) else None
+                    if not isinstance(key, str) or not key:
+                        continue
+                    if key in seen:
+                        errors.append(f"{location}[{index}].{field}: duplicate {key!r}, "
+                                      f"already used by {location}[{seen[key]}]")
+                    else:
+                        seen[key] = index
+        checks.append(check_unique)
+
+    def validate(value, location, errors):
+        if not isinstance(value, types) or (exclude_bool and isinstance(value, bool)):
+            errors.append(f"{location or 'scenario'}: expected {name}, got {type(value).__name__}")
+            return
+        for check in checks:
+            check(value, location, errors)
+
+    return validate
+
+
+SCENARIO_VALIDATOR = compile_schema(SCENARIO_SCHEMA)
+
+
+def validate_scenario(data: Any) -> list[str]:
+    errors = []
+    SCENARIO_VALIDATOR(data, "", errors)
+    return errors
+
+
 def format_env_vars(env_dict: dict) -> str:
     if not env_dict:
         return " []"
@@ -111,43 +398,237 @@ def format_env_vars(env_dict: dict) -> str:
     return "\n" + "\n".join(lines)
 
 
+def iter_depends_on(services, condition: str = "service_healthy") -> Iterator[str]:
+    yield "\n"
+    for index, service in enumerate(services):
+        if index:
+            yield "\n"
+        yield f"      {service}:\n        condition: {condition}"
+
+
 def format_depends_on(services: list) -> str:
-    lines = []
-    for service in services:
-        lines.append(f"      {service}:")
-        lines.append(f"        condition: service_healthy")
-    return "\n" + "\n".join(lines)
+    return "".join(iter_depends_on(services))
+
+
+def namespace_fields(run_id: str | None) -> dict[str, str]:
+    # Service names (the in-network DNS names) stay as-is; only host-global names are prefixed
+    if run_id is None:
+        return {"project_name": "", "container_prefix": "", "network_name": ""}
 
+    if not RUN_ID_PATTERN.match(run_id):
+        raise ValueError(f"Invalid run ID '{run_id}': use lowercase letters, digits, '-' and '_'")
+    return {
+        "project_name": f"name: {run_id}\n",
+        "container_prefix": f"{run_id}-",
+        "network_name": f"    name: {run_id}-agent-network\n",
+    }
 
-def generate_docker_compose(scenario: dict[str, Any]) -> str:
+
+def iter_docker_compose(scenario: dict[str, Any], run_id: str | None = None, port: int = DEFAULT_PORT,
+                        startup: str = "healthy", quorum: int | None = None,
+                        healthchecks: dict[str, dict[str, Any]] | None = None,
+                        image_mirror: str | None = None,
+                        resources: dict[str, dict[str, Any]] | None = None,
+                        green_volumes: list[str] | None = None) -> Iterator[str]:
     green = scenario["green_agent"]
     participants = scenario.get("participants", [])
 
-    participant_names = [p["name"] for p in participants]
+    if startup not in STARTUP_MODES:
+        raise ValueError(f"Unknown startup mode '{startup}', expected one of {', '.join(STARTUP_MODES)}")
+    staged = startup == "staged"
+    if quorum is None:
+        quorum = len(participants)
+    if staged and not 0 <= quorum <= len(participants):
+        raise ValueError(f"Quorum {quorum} must be between 0 and {len(participants)} participants")
+
+    fields = {
+        "green_image": mirror_image(green["image"], image_mirror),
+        "green_port": port,
+        "green_env": format_env_vars(green.get("env", {})),
+        "client_image": mirror_image(CLIENT_IMAGE, image_mirror),
+        **namespace_fields(run_id),
+    }
+    resources = resources or {}
+    fields["green_resources"] = format_resources(resources.get("green-agent"))
+    fields["client_resources"] = format_resources(resources.get("agentbeats-client"))
+    fields["green_volumes"] = format_volumes(green_volumes or [])
+    healthchecks = healthchecks or {}
+    green_healthcheck = healthchecks.get(green["image"], DEFAULT_HEALTHCHECK)
+    fields.update({f"green_{key}": value for key, value in green_healthcheck.items()})
 
-    participant_services = "\n".join([
-        PARTICIPANT_TEMPLATE.format(
+    yield COMPOSE_HEAD.format(**fields)
+    if staged:
+        yield " []"
+    else:
+        yield from iter_depends_on(p["name"] for p in participants)
+    yield COMPOSE_AFTER_GREEN_DEPENDS.format(**fields)
+
+    for index, p in enumerate(participants):
+        if index:
+            yield "\n"
+        yield PARTICIPANT_TEMPLATE.format(
             name=p["name"],
-            image=p["image"],
-            port=DEFAULT_PORT,
-            env=format_env_vars(p.get("env", {}))
+            image=mirror_image(p["image"], image_mirror),
+            port=port,
+            env=format_env_vars(p.get("env", {})),
+            container_prefix=fields["container_prefix"],
+            resources=format_resources(resources.get(p["name"])),
+            **healthchecks.get(p["image"], DEFAULT_HEALTHCHECK)
         )
-        for p in participants
-    ])
-
-    all_services = ["green-agent"] + participant_names
-
-    return COMPOSE_TEMPLATE.format(
-        green_image=green["image"],
-        green_port=DEFAULT_PORT,
-        green_env=format_env_vars(green.get("env", {})),
-        green_depends=format_depends_on(participant_names),
-        participant_services=participant_services,
-        client_depends=format_depends_on(all_services)
-    )
+
+    if staged:
+        yield "\n"
+        yield STARTUP_GATE_TEMPLATE.format(
+            gate_image=mirror_image(STARTUP_GATE_IMAGE, image_mirror),
+            port=port,
+            participants=" ".join(p["name"] for p in participants),
+            quorum=quorum,
+            timeout=STARTUP_GATE_TIMEOUT,
+            poll_interval=STARTUP_GATE_POLL_INTERVAL,
+            container_prefix=fields["container_prefix"]
+        )
+
+    yield COMPOSE_AFTER_PARTICIPANTS.format(**fields)
+    if staged:
+        yield from iter_depends_on(["startup-gate"], "service_completed_successfully")
+    else:
+        yield from iter_depends_on(itertools.chain(["green-agent"], (p["name"] for p in participants)))
+    yield COMPOSE_TAIL.format(**fields)
+
+
+def parse_size_mib(value: str) -> int:
+    # QEMU -m accepts "1G", "512M", "2048" (MiB) and "size=1G,slots=2,maxmem=4G"
+    size = value.split(",")[0].removeprefix("size=").strip().lower().removesuffix("b")
+    unit = size[-1] if size and size[-1] in SIZE_UNITS_MIB else "m"
+    return max(1, round(float(size.rstrip("kmgt")) * SIZE_UNITS_MIB[unit]))
+
+
+def parse_smp_cpus(value: str) -> int:
+    # QEMU -smp accepts "4" or "cpus=4,sockets=1,..."
+    for part in value.split(","):
+        key, _, number = part.rpartition("=")
+        if key in ("", "cpus") and number.isdigit():
+            return int(number)
+    return DEFAULT_VM_CPUS
+
+
+def vm_resources(scenario: dict[str, Any]) -> tuple[int, int]:
+    command = [str(arg) for arg in scenario.get("config", {}).get("vm_command", [])]
+    cpus, memory_mib = DEFAULT_VM_CPUS, DEFAULT_VM_MEMORY_MIB
+    for flag, value in zip(command, command[1:]):
+        if flag == "-m":
+            memory_mib = parse_size_mib(value)
+        elif flag == "-smp":
+            cpus = parse_smp_cpus(value)
+    return cpus, memory_mib
 
 
-def generate_a2a_scenario(scenario: dict[str, Any]) -> str:
+def plan_resources(scenario: dict[str, Any], max_cpus: int | None = None) -> dict[str, dict[str, Any]]:
+    # Docker rejects a cpus limit above the host's core count, so max_cpus caps every service
+    vm_cpus, vm_memory_mib = vm_resources(scenario)
+    plan = {
+        "green-agent": {
+            "cpus": vm_cpus + GREEN_OVERHEAD_CPUS,
+            "memory_mib": vm_memory_mib + GREEN_OVERHEAD_MEMORY_MIB,
+        },
+    }
+    for p in scenario.get("participants", []):
+        limits = dict(DEFAULT_PARTICIPANT_RESOURCES)
+        requested = p.get("resources", {})
+        if "cpus" in requested:
+            limits["cpus"] = requested["cpus"]
+        if "memory" in requested:
+            limits["memory_mib"] = parse_size_mib(str(requested["memory"]))
+        plan[p["name"]] = limits
+    plan["agentbeats-client"] = dict(CLIENT_RESOURCES)
+    if max_cpus:
+        for limits in plan.values():
+            limits["cpus"] = min(limits["cpus"], max_cpus)
+    return plan
+
+
+def assign_cpusets(plan: dict[str, dict[str, Any]], cores: list[int]) -> dict[str, dict[str, Any]]:
+    # Agents get disjoint slices of the run's cores; the lightweight client shares the green agent's.
+    # When the plan needs more cores than were leased, the slices wrap around and overlap,
+    # and each service's cpus is capped to its slice
+    assigned = {}
+    offset = 0
+    for service, limits in plan.items():
+        if service == "agentbeats-client":
+            continue
+        count = min(math.ceil(limits["cpus"]), len(cores))
+        cpuset = sorted(cores[(offset + i) % len(cores)] for i in range(count))
+        assigned[service] = {**limits, "cpus": min(limits["cpus"], count), "cpuset": cpuset}
+        offset += count
+    green_cpuset = assigned["green-agent"]["cpuset"]
+    client = plan["agentbeats-client"]
+    assigned["agentbeats-client"] = {**client, "cpus": min(client["cpus"], len(green_cpuset)), "cpuset": green_cpuset}
+    return assigned
+
+
+def cores_needed(plan: dict[str, dict[str, Any]]) -> int:
+    return sum(math.ceil(limits["cpus"]) for service, limits in plan.items() if service != "agentbeats-client")
+
+
+def format_resources(limits: dict[str, Any] | None) -> str:
+    if not limits:
+        return ""
+    lines = [f"    cpus: {limits['cpus']}", f"    mem_limit: {limits['memory_mib']}m"]
+    if limits.get("cpuset"):
+        lines.append(f"    cpuset: \"{','.join(map(str, limits['cpuset']))}\"")
+    return "\n".join(lines) + "\n"
+
+
+def format_volumes(volumes: list[str]) -> str:
+    if not volumes:
+        return ""
+    return "    volumes:\n" + "".join(f"      - {volume}\n" for volume in volumes)
+
+
+def mirror_image(image: str, mirror: str | None) -> str:
+    # registry.example/org/name:tag -> <mirror>/org/name:tag; Docker Hub names get library/
+    if not mirror:
+        return image
+    first, _, rest = image.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        path = rest
+    elif rest:
+        path = image
+    else:
+        path = f"library/{image}"
+    return f"{mirror}/{path}"
+
+
+def generate_pull_plan(scenario: dict[str, Any], startup: str = "healthy", image_mirror: str | None = None) -> dict[str, Any]:
+    services = [("green-agent", scenario["green_agent"]["image"], AGENT_PLATFORM)]
+    services += [(p["name"], p["image"], AGENT_PLATFORM) for p in scenario.get("participants", [])]
+    if startup == "staged":
+        services.append(("startup-gate", STARTUP_GATE_IMAGE, None))
+    services.append(("agentbeats-client", CLIENT_IMAGE, AGENT_PLATFORM))
+
+    images: dict[tuple[str, str | None], list[str]] = {}
+    for service, image, platform in services:
+        images.setdefault((mirror_image(image, image_mirror), platform), []).append(service)
+
+    return {
+        "images": [
+            {"image": image, "platform": platform, "services": names}
+            for (image, platform), names in images.items()
+        ],
+        "concurrency": min(len(images), MAX_PULL_CONCURRENCY),
+    }
+
+
+def write_docker_compose(scenario: dict[str, Any], f: TextIO, **options):
+    for chunk in iter_docker_compose(scenario, **options):
+        f.write(chunk)
+
+
+def generate_docker_compose(scenario: dict[str, Any], **options) -> str:
+    return "".join(iter_docker_compose(scenario, **options))
+
+
+def generate_a2a_scenario(scenario: dict[str, Any], port: int = DEFAULT_PORT) -> str:
     green = scenario["green_agent"]
     participants = scenario.get("participants", [])
 
@@ -156,37 +637,55 @@ def generate_a2a_scenario(scenario: dict[str, Any]) -> str:
         participant_lines.append(
             f"[[participants]]\n"
             f"role = \"{p['name']}\"\n"
-            f"endpoint = \"http://{p['name']}:{DEFAULT_PORT}\"\n"
+            f"endpoint = \"http://{p['name']}:{port}\"\n"
             f"agentbeats_id = \"{p['agentbeats_id']}\"\n"
         )
 
     config_section = scenario.get("config", {})
-    config_lines = [tomli_w.dumps({"config": config_section})]
+    config_lines = [load_tomli_w().dumps({"config": config_section})]
 
     return A2A_SCENARIO_TEMPLATE.format(
-        green_port=DEFAULT_PORT,
+        green_port=port,
         participants="\n".join(participant_lines),
         config="\n".join(config_lines)
     )
 
 
-def generate_env_file(scenario: dict[str, Any]) -> str:
-    green = scenario["green_agent"]
-    participants = scenario.get("participants", [])
-
-    secrets = set()
+def scan_secrets(value: Any, location: str = "", in_env: bool = False,
+                 literals: bool = True) -> Iterator[tuple[str, str, str]]:
+    # One walk over the parsed scenario, in document order, yielding (location, kind, name):
+    #   reference      ${VAR} in an agent env, filled in by docker compose from .env
+    #   unsubstituted  ${VAR} anywhere else; it reaches the green agent verbatim
+    #   literal        a secret-looking agent env variable with a plain value
+    # Scalars are checked inline and locations built only for findings, since env tables can be huge
+    if isinstance(value, dict):
+        items = value.items()
+        agent_level = ENV_PARENT_PATTERN.match(location) is not None
+        prefix = f"{location}." if location else ""
+        suffix = ""
+    elif isinstance(value, list):
+        items = enumerate(value, start=1)
+        agent_level = False
+        prefix, suffix = f"{location}[", "]"
+    else:
+        items = [(None, value)]
+        agent_level = False
+        prefix = suffix = ""
 
-    # Extract secrets from ${VAR} patterns in env values
-    env_var_pattern = re.compile(r'\$\{([^}]+)\}')
+    for key, item in items:
+        if isinstance(item, str):
+            if "${" in item:
+                kind = "reference" if in_env else "unsubstituted"
+                for name in SECRET_REFERENCE_PATTERN.findall(item):
+                    yield (f"{prefix}{key}{suffix}" if key is not None else location), kind, name
+            elif literals and in_env and item and suffix == "" and SECRET_NAME_PATTERN.search(key):
+                yield f"{prefix}{key}", "literal", key
+        elif isinstance(item, (dict, list)):
+            yield from scan_secrets(item, f"{prefix}{key}{suffix}", in_env or (agent_level and key == "env"), literals)
 
-    for value in green.get("env", {}).values():
-        for match in env_var_pattern.findall(str(value)):
-            secrets.add(match)
 
-    for p in participants:
-        for value in p.get("env", {}).values():
-            for match in env_var_pattern.findall(str(value)):
-                secrets.add(match)
+def generate_env_file(scenario: dict[str, Any]) -> str:
+    secrets = {name for _, kind, name in scan_secrets(scenario, literals=False) if kind == "reference"}
 
     if not secrets:
         return ""
@@ -198,27 +697,577 @@ def generate_env_file(scenario: dict[str, Any]) -> str:
     return "\n".join(lines) + "\n"
 
 
+def hostfwd_ports(scenario: dict[str, Any]) -> list[int]:
+    ports = []
+    for arg in scenario.get("config", {}).get("vm_command", []):
+        for _, port, _ in HOSTFWD_PATTERN.findall(str(arg)):
+            if int(port) not in ports:
+                ports.append(int(port))
+    return ports
+
+
+def remap_config_ports(value: Any, mapping: dict[int, int], pattern: re.Pattern) -> Any:
+    def replace(match):
+        port = int(match.group(2))
+        return f"{match.group(1)}{mapping.get(port, port)}{match.group(3)}"
+
+    if isinstance(value, str):
+        return pattern.sub(replace, value)
+    if isinstance(value, list):
+        return [remap_config_ports(item, mapping, pattern) for item in value]
+    if isinstance(value, dict):
+        return {key: remap_config_ports(item, mapping, pattern) for key, item in value.items()}
+    return value
+
+
+def remap_ports(scenario: dict[str, Any], mapping: dict[int, int]) -> dict[str, Any]:
+    config = dict(scenario.get("config", {}))
+    for key, value in config.items():
+        pattern = HOSTFWD_PATTERN if key == "vm_command" else CONFIG_PORT_PATTERN
+        config[key] = remap_config_ports(value, mapping, pattern)
+    return {**scenario, "config": config}
+
+
+def lease_ports(scenario: dict[str, Any], run_id: str) -> tuple[dict[str, Any], int]:
+    # Reserves the agent port plus every VM hostfwd port for this run on the host
+    import host_leases
+
+    original = [DEFAULT_PORT] + hostfwd_ports(scenario)
+    allocated = host_leases.allocate_ports(run_id, len(original))
+    mapping = dict(zip(original, allocated))
+    return remap_ports(scenario, mapping), mapping[DEFAULT_PORT]
+
+
+def use_vm_pool_instance(scenario: dict[str, Any], instance_dir: Path) -> tuple[dict[str, Any], list[str]]:
+    # Restores the green agent's VM from a vm_pool.py snapshot instead of cold-booting it
+    import vm_pool
+
+    instance_path = instance_dir / vm_pool.INSTANCE_PATH
+    if not instance_path.exists():
+        raise ValueError(f"{instance_dir} is not a vm_pool.py instance")
+    config = dict(scenario.get("config", {}))
+    if not config.get("vm_command"):
+        raise ValueError("--vm-pool-instance needs a [config].vm_command to restore")
+    vm_command = [str(arg) for arg in config["vm_command"]]
+    # QEMU only restores a state saved by the same machine and devices, so fail here rather than at -incoming
+    signature = vm_pool.vm_signature(vm_command)
+    saved = json.loads(instance_path.read_text()).get("signature")
+    if saved != signature:
+        raise ValueError(f"{instance_dir} was saved for another vm_command (signature {saved}, this one is {signature})")
+    config["vm_command"] = vm_pool.pooled_vm_command(vm_command)
+    volume = f"{instance_dir.resolve()}:{vm_pool.VM_POOL_MOUNT}:ro"
+    return {**scenario, "config": config}, [volume]
+
+
+def prepare_run(scenario: dict[str, Any], options: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    # Turns host-level requests (port and CPU leases) into plain generator options
+    options = dict(options)
+    allocate_ports = options.pop("allocate_ports", False)
+    limit_resources = options.pop("limit_resources", False)
+    pin_cpus = options.pop("pin_cpus", False)
+    vm_pool_instance = options.pop("vm_pool_instance", None)
+
+    if (allocate_ports or pin_cpus) and not options.get("run_id"):
+        raise ValueError("--allocate-ports and --pin-cpus require --run-id")
+
+    if allocate_ports:
+        scenario, options["port"] = lease_ports(scenario, options["run_id"])
+
+    if vm_pool_instance:
+        scenario, options["green_volumes"] = use_vm_pool_instance(scenario, Path(vm_pool_instance))
+
+    if limit_resources or pin_cpus:
+        import host_leases
+
+        host_cpus = len(host_leases.host_cores())
+        plan = plan_resources(scenario, host_cpus)
+        if pin_cpus:
+            # A plan larger than the host leases every core and shares them between services
+            try:
+                cores = host_leases.allocate_cpus(options["run_id"], min(cores_needed(plan), host_cpus))
+            except RuntimeError:
+                host_leases.release(options["run_id"])
+                raise
+            plan = assign_cpusets(plan, cores)
+        options["resources"] = plan
+
+    return scenario, options
+
+
+def scenario_cache_key(scenario: dict[str, Any], options: dict[str, Any] | None = None) -> str:
+    normalized = json.dumps([scenario, options or {}], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{GENERATOR_VERSION}\n{normalized}".encode()).hexdigest()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_cache(output_dir: Path) -> dict[str, Any]:
+    try:
+        return json.loads((output_dir / CACHE_PATH).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def cache_is_fresh(cache: dict[str, Any], key: str, output_dir: Path) -> bool:
+    if cache.get("key") != key:
+        return False
+    for name, digest in cache.get("files", {}).items():
+        try:
+            if file_hash(output_dir / name) != digest:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def write_if_changed(path: Path, content: str) -> bool:
+    # Leave identical files alone so their mtime stays put
+    try:
+        if path.read_text() == content:
+            return False
+    except OSError:
+        pass
+    with open(path, "w") as f:
+        f.write(content)
+    return True
+
+
+def stream_if_changed(path: Path, chunks) -> tuple[bool, str]:
+    # Stream into a temporary file, hashing as we go, and only swap it in if it differs
+    tmp_path = path.with_name(path.name + ".tmp")
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, "w") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk.encode())
+    except BaseException:
+        # The generator runs inside this loop, so its errors would otherwise leave the partial file behind
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    try:
+        unchanged = file_hash(path) == digest.hexdigest()
+    except OSError:
+        unchanged = False
+
+    if unchanged:
+        tmp_path.unlink()
+    else:
+        os.replace(tmp_path, path)
+    return not unchanged, digest.hexdigest()
+
+
+def timed_chunks(chunks, timings: dict[str, float], phase: str) -> Iterator[str]:
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(iterator, None)
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+        if chunk is None:
+            return
+        yield chunk
+
+
+def write_artifacts(scenario: dict[str, Any], output_dir: Path = Path("."), use_cache: bool = True,
+                    timings: dict[str, float] | None = None, options: dict[str, Any] | None = None) -> tuple[bool, list[str]]:
+    timings = {} if timings is None else timings
+    for phase in ("cache", "generate", "write"):
+        timings.setdefault(phase, 0.0)
+
+    start = time.perf_counter()
+    options = options or {}
+    key = scenario_cache_key(scenario, options)
+    cache = load_cache(output_dir) if use_cache else {}
+    fresh = cache_is_fresh(cache, key, output_dir)
+    timings["cache"] += time.perf_counter() - start
+    if fresh:
+        return ENV_PATH in cache["files"], []
+
+    start = time.perf_counter()
+    generated_before = timings["generate"]
+    compose_chunks = timed_chunks(iter_docker_compose(scenario, **options), timings, "generate")
+    compose_changed, compose_hash = stream_if_changed(output_dir / COMPOSE_PATH, compose_chunks)
+    timings["write"] += time.perf_counter() - start - (timings["generate"] - generated_before)
+    written = [COMPOSE_PATH] if compose_changed else []
+    hashes = {COMPOSE_PATH: compose_hash}
+
+    start = time.perf_counter()
+    artifacts = {A2A_SCENARIO_PATH: generate_a2a_scenario(scenario, options.get("port", DEFAULT_PORT))}
+    env_content = generate_env_file(scenario)
+    if env_content:
+        artifacts[ENV_PATH] = env_content
+    timings["generate"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name, content in artifacts.items():
+        if write_if_changed(output_dir / name, content):
+            written.append(name)
+        hashes[name] = content_hash(content)
+
+    if use_cache:
+        cache = {"key": key, "files": hashes}
+        write_if_changed(output_dir / CACHE_PATH, json.dumps(cache, indent=2) + "\n")
+    timings["write"] += time.perf_counter() - start
+
+    return bool(env_content), written
+
+
+def format_timings(timings: dict[str, float]) -> str:
+    lines = [f"  {phase:<10}{seconds * 1000:>9.2f}ms" for phase, seconds in timings.items()]
+    lines.append(f"  {'total':<10}{sum(timings.values()) * 1000:>9.2f}ms")
+    return "Timings:\n" + "\n".join(lines)
+
+
+def find_scenarios(pattern: str) -> list[Path]:
+    import glob
+
+    path = Path(pattern)
+    if path.is_dir():
+        return sorted(path.glob("*.toml"))
+    return sorted(Path(p) for p in glob.glob(pattern))
+
+
+def generate_batch_item(scenario_path: Path, output_dir: Path, use_cache: bool = True,
+                        options: dict[str, Any] | None = None) -> tuple[Path, float, str | None]:
+    import contextlib
+    import io
+
+    start = time.perf_counter()
+    # parse_scenario reports problems on stdout and exits; keep that as the error
+    with contextlib.redirect_stdout(io.StringIO()) as captured:
+        try:
+            scenario = parse_scenario(scenario_path)
+            options = options or {}
+            scenario, options = prepare_run(scenario, options)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            write_artifacts(scenario, output_dir, use_cache, options=options)
+            error = None
+        except SystemExit:
+            error = captured.getvalue().strip() or "parse_scenario exited"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return scenario_path, time.perf_counter() - start, error
+
+
+def batch_options(options: dict[str, Any], scenario_path: Path) -> dict[str, Any]:
+    # Every scenario of a batch gets its own namespace under the given run ID
+    if options.get("run_id"):
+        return {**options, "run_id": f"{options['run_id']}-{scenario_path.stem.lower()}"}
+    return options
+
+
+def run_batch(pattern: str, output_root: Path, jobs: int | None, use_cache: bool = True,
+              options: dict[str, Any] | None = None) -> int:
+    from concurrent.futures import ProcessPoolExecutor
+
+    scenario_paths = find_scenarios(pattern)
+    if not scenario_paths:
+        print(f"Error: no scenarios match {pattern}")
+        return 1
+
+    start = time.perf_counter()
+    if jobs == 1:
+        outcomes = [
+            generate_batch_item(path, output_root / path.stem, use_cache, batch_options(options or {}, path))
+            for path in scenario_paths
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(generate_batch_item, path, output_root / path.stem, use_cache,
+                                batch_options(options or {}, path))
+                for path in scenario_paths
+            ]
+            outcomes = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    failures = [(path, error) for path, _, error in outcomes if error]
+    durations = sorted(duration for _, duration, _ in outcomes)
+
+    print(f"Generated {len(outcomes) - len(failures)}/{len(outcomes)} scenarios into {output_root} in {elapsed:.2f}s")
+    print(f"Per scenario: min {durations[0] * 1000:.1f}ms, "
+          f"median {durations[len(durations) // 2] * 1000:.1f}ms, max {durations[-1] * 1000:.1f}ms")
+    for path, error in failures:
+        print(f"Failed {path}: {error}")
+
+    return 1 if failures else 0
+
+
+def audit_secrets(scenario_paths: list[Path]) -> int:
+    # Reports only what needs attention; plain ${VAR} references in agent env are expected
+    tomli = load_tomli()
+    start = time.perf_counter()
+    variables = set()
+    counts = {"reference": 0, "unsubstituted": 0, "literal": 0}
+    failures = 0
+
+    for path in scenario_paths:
+        try:
+            scenario = tomli.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            print(f"Failed {path}: {e}")
+            failures += 1
+            continue
+        for location, kind, name in scan_secrets(scenario):
+            counts[kind] += 1
+            if kind == "reference":
+                variables.add(name)
+            else:
+                print(f"{path}: {location}: {kind} {name}")
+
+    elapsed = time.perf_counter() - start
+    print(f"Scanned {len(scenario_paths)} scenario(s) in {elapsed:.2f}s: {counts['reference']} reference(s) to "
+          f"{len(variables)} variable(s) ({', '.join(sorted(variables)) or 'none'}), "
+          f"{counts['unsubstituted']} unsubstituted, {counts['literal']} literal")
+    return 1 if failures or counts["literal"] else 0
+
+
+def validate_file(scenario_path: Path) -> tuple[Path, list[str], float, float]:
+    tomli = load_tomli()
+    start = time.perf_counter()
+    try:
+        data = tomli.loads(scenario_path.read_text())
+    except (OSError, ValueError) as e:
+        return scenario_path, [f"cannot parse: {e}"], time.perf_counter() - start, 0.0
+    parsed = time.perf_counter()
+    errors = validate_scenario(data)
+    return scenario_path, errors, parsed - start, time.perf_counter() - parsed
+
+
+def validate_scenarios(scenario_paths: list[Path], jobs: int | None) -> int:
+    start = time.perf_counter()
+    if jobs == 1 or len(scenario_paths) == 1:
+        outcomes = [validate_file(path) for path in scenario_paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Files are tiny, so hand them to the workers in large chunks
+        workers = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(scenario_paths) // (workers * 4))
+            outcomes = list(executor.map(validate_file, scenario_paths, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    invalid = 0
+    for path, errors, _, _ in outcomes:
+        if errors:
+            invalid += 1
+        for error in errors:
+            print(f"{path}: {error}")
+
+    parse_seconds = sum(outcome[2] for outcome in outcomes)
+    validate_seconds = sum(outcome[3] for outcome in outcomes)
+    print(f"Validated {len(outcomes)} scenario(s) in {elapsed:.2f}s (parse {parse_seconds:.2f}s, "
+          f"validate {validate_seconds * 1000:.1f}ms): {invalid} invalid, "
+          f"{sum(len(outcome[1]) for outcome in outcomes)} error(s)")
+    return 1 if invalid else 0
+
+
+def start_profiling(profile: Path | None, profile_memory: Path | None):
+    if profile_memory:
+        import tracemalloc
+
+        tracemalloc.start(PROFILE_MEMORY_FRAMES)
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    return None
+
+
+def write_profiles(profiler, profile: Path | None, profile_memory: Path | None):
+    # Both collectors stop before any reporting so the reports do not profile themselves.
+    # Text reports go to the given paths, raw .pstats/.snapshot files next to them for later diffing
+    if profile_memory:
+        import tracemalloc
+
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    if profiler is not None:
+        profiler.disable()
+
+    if profiler is not None:
+        import io
+        import pstats
+
+        profiler.dump_stats(f"{profile}.pstats")
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report).strip_dirs()
+        for key in ("cumulative", "tottime"):
+            report.write(f"## Sorted by {key}\n")
+            stats.sort_stats(key).print_stats(PROFILE_TOP)
+        profile.write_text(report.getvalue())
+        print(f"Wrote CPU profile to {profile}", file=sys.stderr)
+
+    if profile_memory:
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        snapshot.dump(f"{profile_memory}.snapshot")
+        lines = [f"Peak traced memory: {peak / 1024:.1f} KiB", "", "## Live allocations by line"]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP]]
+        lines += ["", "## Live allocations by traceback"]
+        for stat in snapshot.statistics("traceback")[:PROFILE_TOP // 4]:
+            lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} block(s)")
+            lines += [f"    {line}" for line in stat.traceback.format()]
+        profile_memory.write_text("\n".join(lines) + "\n")
+        print(f"Wrote memory profile to {profile_memory}", file=sys.stderr)
+
+
 def main():
+    import argparse
+
+    timings = {"startup": STARTUP_CPU_SECONDS, "import": time.perf_counter() - IMPORT_START}
+    span_start = time.monotonic() - timings["import"]
+
     parser = argparse.ArgumentParser(description="Generate Docker Compose from scenario.toml")
-    parser.add_argument("--scenario", type=Path)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--scenario", type=Path)
+    source.add_argument("--batch", metavar="DIR_OR_GLOB", help="Generate every matching scenario into its own directory")
+    parser.add_argument("--output-dir", type=Path,
+                        help="Output directory (default: current directory, or generated/ for --batch)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Batch worker processes")
+    parser.add_argument("--no-cache", action="store_true", help=f"Ignore {CACHE_PATH} and regenerate everything")
+    parser.add_argument("--timings", action="store_true",
+                        help="Report startup (CPU time before import), import, parse, generate and write phases on stderr")
+    parser.add_argument("--audit-secrets", action="store_true",
+                        help="Only scan the scenario(s) for secret references and plain-text secrets, generate nothing")
+    parser.add_argument("--validate", action="store_true",
+                        help="Only check the scenario(s) against the schema and report every error, generate nothing")
+    parser.add_argument("--timings-json", type=Path, metavar="PATH",
+                        help="Append a 'generate' span with the phase timings to this phase_timer.py timings file")
+    parser.add_argument("--profile", type=Path, metavar="PATH",
+                        help="Run under cProfile and write the hottest functions (and raw PATH.pstats) to PATH; implies --no-cache")
+    parser.add_argument("--profile-memory", type=Path, metavar="PATH",
+                        help="Run under tracemalloc and write the allocation report (and raw PATH.snapshot) to PATH; implies --no-cache")
+    parser.add_argument("--run-id", help="Namespace compose project, container and network names for parallel runs")
+    parser.add_argument("--allocate-ports", action="store_true",
+                        help="Lease a host-wide port block for the run and rewrite agent and VM ports to it")
+    parser.add_argument("--resources", action="store_true",
+                        help="Emit cpus/mem_limit per service, sizing the green agent from -m/-smp in vm_command")
+    parser.add_argument("--pin-cpus", action="store_true",
+                        help="Also lease disjoint host cores for the run and emit cpuset per service (needs --run-id)")
+    parser.add_argument("--startup", choices=STARTUP_MODES, default="healthy",
+                        help="healthy: green agent and client wait for every participant's healthcheck; "
+                             "staged: all agents start in parallel and a startup-gate service releases the client")
+    parser.add_argument("--quorum", type=int,
+                        help="With --startup staged, participants that must be ready before the client starts (default: all)")
+    parser.add_argument("--image-mirror", metavar="HOST:PORT",
+                        help="Rewrite every image reference to this registry mirror (see image_cache.py serve)")
+    parser.add_argument("--pull-plan", type=Path, help="Also write the deduplicated image pull plan (JSON) to this path")
+    parser.add_argument("--vm-pool-instance", type=Path,
+                        help="Restore the CTF VM from a pre-booted vm_pool.py instance directory instead of booting it")
+    parser.add_argument("--healthcheck-history", type=Path,
+                        help="Derive per-image healthcheck timings from a readiness.py history file")
     args = parser.parse_args()
 
+    # A cache hit skips parsing and generation, which are what a profile is for
+    use_cache = not (args.no_cache or args.profile or args.profile_memory)
+    options = {}
+    if args.healthcheck_history:
+        import readiness
+
+        options["healthchecks"] = readiness.healthcheck_params(readiness.load_history(args.healthcheck_history))
+    if args.run_id:
+        options["run_id"] = args.run_id
+    if args.image_mirror:
+        options["image_mirror"] = args.image_mirror
+    if args.startup != "healthy":
+        options["startup"] = args.startup
+    if args.quorum is not None:
+        options["quorum"] = args.quorum
+    if args.allocate_ports:
+        options["allocate_ports"] = True
+    if args.resources:
+        options["limit_resources"] = True
+    if args.pin_cpus:
+        options["pin_cpus"] = True
+    if args.vm_pool_instance:
+        options["vm_pool_instance"] = str(args.vm_pool_instance)
+
+    if args.audit_secrets or args.validate:
+        scenario_paths = find_scenarios(args.batch) if args.batch else [args.scenario]
+        if not scenario_paths:
+            print(f"Error: no scenarios match {args.batch}")
+            sys.exit(1)
+        code = 0
+        if args.validate:
+            code = validate_scenarios(scenario_paths, args.jobs)
+        if args.audit_secrets:
+            code = audit_secrets(scenario_paths) or code
+        sys.exit(code)
+
+    if args.batch:
+        jobs = args.jobs
+        if args.profile or args.profile_memory:
+            # Worker processes are invisible to the profilers, so profile the batch in-process
+            jobs = 1
+        profiler = start_profiling(args.profile, args.profile_memory)
+        try:
+            code = run_batch(args.batch, args.output_dir or Path("generated"), jobs, use_cache, options)
+        finally:
+            write_profiles(profiler, args.profile, args.profile_memory)
+        sys.exit(code)
+
     if not args.scenario.exists():
         print(f"Error: {args.scenario} not found")
         sys.exit(1)
 
-    scenario = parse_scenario(args.scenario)
+    profiler = start_profiling(args.profile, args.profile_memory)
+    try:
+        start = time.perf_counter()
+        scenario = parse_scenario(args.scenario)
+        timings["parse"] = time.perf_counter() - start
 
-    with open(COMPOSE_PATH, "w") as f:
-        f.write(generate_docker_compose(scenario))
+        allocate_ports = options.get("allocate_ports")
+        scenario, options = prepare_run(scenario, options)
+        if allocate_ports:
+            print(f"Leased ports for {options['run_id']}: agents {options['port']}, "
+                  f"VM {', '.join(map(str, hostfwd_ports(scenario))) or 'none'}")
+        if args.pin_cpus:
+            print(f"Leased CPUs for {options['run_id']}: "
+                  + ", ".join(f"{service} {limits['cpuset']}" for service, limits in options["resources"].items()))
 
-    with open(A2A_SCENARIO_PATH, "w") as f:
-        f.write(generate_a2a_scenario(scenario))
+        output_dir = args.output_dir or Path(".")
+        output_dir.mkdir(parents=True, exist_ok=True)
+        has_env, written = write_artifacts(scenario, output_dir, use_cache, timings, options)
+    except (ImportError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        write_profiles(profiler, args.profile, args.profile_memory)
 
-    env_content = generate_env_file(scenario)
-    if env_content:
-        with open(ENV_PATH, "w") as f:
-            f.write(env_content)
+    if args.timings:
+        print(format_timings(timings), file=sys.stderr)
+    if args.timings_json:
+        span_end = time.monotonic()
+        import phase_timer
+
+        details = {phase: round(seconds, 6) for phase, seconds in timings.items()}
+        phase_timer.record_spans(args.timings_json, [phase_timer.span("generate", span_start, span_end, **details)])
+
+    if args.pull_plan:
+        plan = generate_pull_plan(scenario, options.get("startup", "healthy"), options.get("image_mirror"))
+        write_if_changed(args.pull_plan, json.dumps(plan, indent=2) + "\n")
+        print(f"Wrote pull plan for {len(plan['images'])} unique image(s) to {args.pull_plan}")
+
+    if not written:
+        print(f"{COMPOSE_PATH} and {A2A_SCENARIO_PATH} are up to date")
+        return
+
+    if has_env:
         print(f"Generated {ENV_PATH}")
 
     print(f"Generated {COMPOSE_PATH} and {A2A_SCENARIO_PATH}")
@@ -0,0 +1,127 @@
+"""Host-wide leases so concurrent scenario runs do not collide on one machine"""
+
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import atomic_files
+
+LEASES_PATH = Path(os.environ.get("CTF_LEASES_PATH", "/tmp/ctf-leaderboard-leases.json"))
+
+PORT_RANGE_START = 20000
+PORT_RANGE_END = 40000
+
+# Leases are kept this long unless released, so crashed runs free their ports eventually
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+
+
+@contextlib.contextmanager
+def locked_table(path: Path = LEASES_PATH):
+    with atomic_files.locked_json(path) as table:
+        drop_expired(table)
+        yield table
+
+
+def drop_expired(table: dict[str, Any]):
+    now = time.time()
+    for kind in list(table):
+        table[kind] = {run_id: lease for run_id, lease in table[kind].items() if lease["expires"] > now}
+
+
+def port_is_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("0.0.0.0", port))
+        except OSError:
+            return False
+    return True
+
+
+def allocate_ports(run_id: str, count: int, ttl: float = DEFAULT_TTL_SECONDS, path: Path = LEASES_PATH,
+                   start: int = PORT_RANGE_START, end: int = PORT_RANGE_END) -> list[int]:
+    with locked_table(path) as table:
+        leases = table.setdefault("ports", {})
+        lease = leases.get(run_id)
+        if lease and len(lease["ports"]) == count:
+            lease["expires"] = time.time() + ttl
+            return lease["ports"]
+        leases.pop(run_id, None)
+
+        taken = {port for other in leases.values() for port in other["ports"]}
+        block_start = start
+        while block_start + count <= end:
+            block = list(range(block_start, block_start + count))
+            busy = [port for port in block if port in taken or not port_is_free(port)]
+            if not busy:
+                leases[run_id] = {"ports": block, "expires": time.time() + ttl}
+                return block
+            block_start = busy[-1] + 1
+
+    raise RuntimeError(f"No free block of {count} ports between {start} and {end}")
+
+
+def host_cores() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def allocate_cpus(run_id: str, count: int, ttl: float = DEFAULT_TTL_SECONDS, path: Path = LEASES_PATH) -> list[int]:
+    with locked_table(path) as table:
+        leases = table.setdefault("cpus", {})
+        lease = leases.get(run_id)
+        if lease and len(lease["cores"]) == count:
+            lease["expires"] = time.time() + ttl
+            return lease["cores"]
+        leases.pop(run_id, None)
+
+        taken = {core for other in leases.values() for core in other["cores"]}
+        free = [core for core in host_cores() if core not in taken]
+        if len(free) < count:
+            raise RuntimeError(f"Run needs {count} cores but only {len(free)} of {len(host_cores())} are free")
+        leases[run_id] = {"cores": free[:count], "expires": time.time() + ttl}
+        return free[:count]
+
+
+def release(run_id: str, path: Path = LEASES_PATH) -> list[str]:
+    released = []
+    with locked_table(path) as table:
+        for kind, leases in table.items():
+            if leases.pop(run_id, None) is not None:
+                released.append(kind)
+    return released
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and release host-wide run leases")
+    parser.add_argument("--leases", type=Path, default=LEASES_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Print active leases")
+    release_parser = subparsers.add_parser("release", help="Release every lease held by a run")
+    release_parser.add_argument("run_id")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        with locked_table(args.leases) as table:
+            for kind, leases in sorted(table.items()):
+                for run_id, lease in sorted(leases.items()):
+                    values = {key: value for key, value in lease.items() if key != "expires"}
+                    expires = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(lease["expires"]))
+                    print(f"{kind:<6} {run_id:<32} {json.dumps(values)} until {expires}")
+        return
+
+    released = release(args.run_id, args.leases)
+    if not released:
+        print(f"Error: no leases held by {args.run_id}")
+        sys.exit(1)
+    print(f"Released {', '.join(released)} lease(s) of {args.run_id}")
+
+if __name__ == "__main__":
+    main()
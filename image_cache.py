@@ -0,0 +1,181 @@
+"""Content-addressed image tarball cache with a local registry mirror"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any
+
+import atomic_files
+from generate_compose import mirror_image
+
+
+CACHE_DIR = Path(os.environ.get("CTF_IMAGE_CACHE", Path.home() / ".cache" / "ctf-leaderboard" / "images"))
+INDEX_PATH = "index.json"
+BLOBS_DIR = "blobs"
+
+REGISTRY_IMAGE = "registry:2"
+REGISTRY_CONTAINER = "ctf-registry-mirror"
+DEFAULT_MIRROR_PORT = 5000
+REGISTRY_START_TIMEOUT = 30
+
+
+def docker(*args: str, check: bool = True) -> subprocess.CompletedProcess:
+    result = subprocess.run(["docker", *args], capture_output=True, text=True)
+    if check and result.returncode:
+        raise RuntimeError(f"docker {' '.join(args)} failed: {result.stderr.strip()}")
+    return result
+
+
+def image_id(ref: str) -> str | None:
+    result = docker("image", "inspect", "--format", "{{.Id}}", ref, check=False)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def load_index(cache_dir: Path) -> dict[str, dict[str, Any]]:
+    path = cache_dir / INDEX_PATH
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_index(cache_dir: Path, index: dict[str, dict[str, Any]]):
+    atomic_files.write_atomic(cache_dir / INDEX_PATH, json.dumps(index, indent=2, sort_keys=True) + "\n")
+
+
+def save_images(cache_dir: Path, images: list[tuple[str, str | None]], pull: bool = True) -> list[str]:
+    # Tarballs are named after the image ID, so tags of the same image share one file
+    index = load_index(cache_dir)
+    blobs_dir = cache_dir / BLOBS_DIR
+    blobs_dir.mkdir(parents=True, exist_ok=True)
+
+    saved = []
+    for ref, platform in images:
+        if pull:
+            docker("pull", "--quiet", *(["--platform", platform] if platform else []), ref)
+        identifier = image_id(ref)
+        if identifier is None:
+            raise RuntimeError(f"{ref} is not available locally; run without --no-pull")
+
+        tarball = blobs_dir / f"{identifier.replace(':', '-')}.tar"
+        if not tarball.exists():
+            tmp_path = tarball.with_name(tarball.name + ".tmp")
+            docker("save", "-o", str(tmp_path), ref)
+            os.replace(tmp_path, tarball)
+            saved.append(ref)
+
+        index[ref] = {"id": identifier, "tarball": tarball.name, "cached": int(time.time())}
+
+    save_index(cache_dir, index)
+    return saved
+
+
+def load_images(cache_dir: Path, refs: list[str] | None = None) -> list[str]:
+    index = load_index(cache_dir)
+    refs = refs or sorted(index)
+
+    loaded = []
+    loaded_tarballs = set()
+    for ref in refs:
+        entry = index.get(ref)
+        if entry is None:
+            raise RuntimeError(f"{ref} is not in the image cache; run image_cache.py save first")
+        if image_id(ref) == entry["id"]:
+            continue
+        if entry["tarball"] not in loaded_tarballs:
+            docker("load", "--quiet", "-i", str(cache_dir / BLOBS_DIR / entry["tarball"]))
+            loaded_tarballs.add(entry["tarball"])
+        docker("tag", entry["id"], ref)
+        loaded.append(ref)
+    return loaded
+
+
+def wait_for_registry(port: int):
+    deadline = time.time() + REGISTRY_START_TIMEOUT
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/v2/", timeout=1):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Registry mirror did not come up on port {port}")
+
+
+def serve_mirror(cache_dir: Path, port: int, refs: list[str] | None = None) -> list[str]:
+    index = load_index(cache_dir)
+    refs = [ref for ref in (refs or sorted(index)) if ref != REGISTRY_IMAGE]
+    load_images(cache_dir, [REGISTRY_IMAGE] + refs)
+
+    running = docker("inspect", "--format", "{{.State.Running}}", REGISTRY_CONTAINER, check=False)
+    if running.stdout.strip() != "true":
+        docker("rm", "-f", REGISTRY_CONTAINER, check=False)
+        docker("run", "-d", "--name", REGISTRY_CONTAINER, "-p", f"127.0.0.1:{port}:5000", REGISTRY_IMAGE)
+    wait_for_registry(port)
+
+    mirror = f"localhost:{port}"
+    for ref in refs:
+        docker("tag", ref, mirror_image(ref, mirror))
+        docker("push", "--quiet", mirror_image(ref, mirror))
+    return refs
+
+
+def plan_images(plan_path: Path | None, refs: list[str]) -> list[tuple[str, str | None]]:
+    images = [(ref, None) for ref in refs]
+    if plan_path:
+        plan = json.loads(plan_path.read_text())
+        images += [(entry["image"], entry.get("platform")) for entry in plan["images"]]
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache images as tarballs and serve them from a local registry mirror")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    save_parser = subparsers.add_parser("save", help="Pull images and store them in the cache")
+    save_parser.add_argument("refs", nargs="*")
+    save_parser.add_argument("--plan", type=Path, help="Cache every image of a generate_compose.py pull plan")
+    save_parser.add_argument("--no-pull", action="store_true", help="Cache the local copies without pulling")
+
+    load_parser = subparsers.add_parser("load", help="docker load cached images that are missing locally")
+    load_parser.add_argument("refs", nargs="*")
+    load_parser.add_argument("--plan", type=Path)
+
+    serve_parser = subparsers.add_parser("serve", help="Run a local registry and push cached images into it")
+    serve_parser.add_argument("refs", nargs="*")
+    serve_parser.add_argument("--plan", type=Path)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_MIRROR_PORT)
+
+    subparsers.add_parser("stop", help="Stop the local registry mirror")
+    subparsers.add_parser("list", help="List cached images")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "save":
+            images = plan_images(args.plan, args.refs) + [(REGISTRY_IMAGE, None)]
+            saved = save_images(args.cache_dir, images, pull=not args.no_pull)
+            print(f"Cached {len(images)} image(s) in {args.cache_dir} ({len(saved)} new tarball(s))")
+        elif args.command == "load":
+            refs = [ref for ref, _ in plan_images(args.plan, args.refs)]
+            loaded = load_images(args.cache_dir, refs)
+            print(f"Loaded {len(loaded)} image(s) from {args.cache_dir}")
+        elif args.command == "serve":
+            refs = [ref for ref, _ in plan_images(args.plan, args.refs)]
+            served = serve_mirror(args.cache_dir, args.port, refs)
+            print(f"Serving {len(served)} image(s) at localhost:{args.port}; "
+                  f"generate with --image-mirror localhost:{args.port}")
+        elif args.command == "stop":
+            docker("rm", "-f", REGISTRY_CONTAINER)
+            print(f"Stopped {REGISTRY_CONTAINER}")
+        else:
+            for ref, entry in sorted(load_index(args.cache_dir).items()):
+                print(f"{ref}\n  {entry['id']} ({entry['tarball']})")
+    except (OSError, RuntimeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
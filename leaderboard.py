@@ -0,0 +1,789 @@
+"""Evaluate queries.json locally against results/*.json"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable
+
+import atomic_files
+import result_stream
+
+RESULTS_DIR = "results"
+QUERIES_PATH = "queries.json"
+STATE_DIR = ".leaderboard"
+TABLE_NAME = "results"
+
+# Points and the names of the files they include, so one atomic write keeps them consistent
+STATE_PATH = "state.json"
+# Before STATE_PATH, points and the ingested names were kept in two files
+LEGACY_POINTS_PATH = "points.json"
+LEGACY_INGESTED_PATH = "ingested.txt"
+ARCHIVE_DIR = "archive"
+AGENTS_DIR = "agents"
+MANIFEST_PATH = "manifest.json"
+
+ARCHIVE_VERSION = 3
+STRING_COLUMNS = ("submission", "role", "agentbeats_id")
+
+AGENT_FILE_NAME = re.compile(r'^[\w.-]+$')
+
+# Workflow runs name submissions <owner>-<YYYYMMDD>-<HHMMSS>
+SUBMISSION_TIMESTAMP = re.compile(r'(\d{8}-\d{6})$')
+
+# Two-sided 95% Student t quantiles for 1..30 degrees of freedom; the normal quantile beyond
+T_CRITICAL_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+Z_CRITICAL_95 = 1.96
+
+# Struct/list access such as participants.red_a or results[1].red_a.points
+PATH_PATTERN = re.compile(r'\b(participants|results)((?:\.\w+|\[\d+\])+)')
+# SELECT * and t.*, but not COUNT(*)
+WILDCARD_PATTERN = re.compile(r'(?<!\()\*')
+
+
+def flatten_result(value: Any, prefix: str, row: dict[str, Any]):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten_result(item, f"{prefix}.{key}" if prefix else key, row)
+    elif isinstance(value, list):
+        for index, item in enumerate(value, start=1):
+            flatten_result(item, f"{prefix}[{index}]", row)
+    else:
+        row[prefix] = value
+
+
+def submission_timestamp(name: str) -> int:
+    match = SUBMISSION_TIMESTAMP.search(name)
+    if not match:
+        return 0
+    try:
+        moment = datetime.strptime(match.group(1), "%Y%m%d-%H%M%S")
+    except ValueError:
+        # Looks like a timestamp but is not a real date, e.g. 20251399-999999
+        return 0
+    return int(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def result_records(submission: str, result: dict[str, Any]):
+    # Round 0 keeps participants that have no round entries. Roles missing from
+    # participants get the agent ID None, unlike participants whose ID is ""
+    participants = result.get("participants", {})
+    seen = set()
+    for round_no, round_data in enumerate(result.get("results", []), start=1):
+        for role, role_data in round_data.items():
+            seen.add(role)
+            yield submission, role, participants.get(role), round_no, role_data.get("points") or 0
+    for role, agent_id in participants.items():
+        if role not in seen:
+            yield submission, role, agent_id, 0, 0
+
+
+def archived_points(value: Any) -> int | float:
+    # What the points column holds. Values it changes are listed in loose_columns and served from the file
+    if isinstance(value, bool):
+        return int(value)
+    return value if isinstance(value, (int, float)) else 0
+
+
+def same_value(a: Any, b: Any) -> bool:
+    return type(a) is type(b) and a == b
+
+
+def unarchived_paths(key: str, index: int | None, value: Any) -> list[str]:
+    # Flattened paths of one top-level item that load_archived_results would not reproduce
+    # exactly: other result fields, points that are missing, null or not numbers, and so on
+    if key == "participants" and isinstance(value, dict) and all(isinstance(v, str) for v in value.values()):
+        return []
+
+    original: dict[str, Any] = {}
+    if key == "results" and index is not None and isinstance(value, dict):
+        # Fast path for the usual round, {role: {"points": number}}
+        if all(type(role_data) is dict and len(role_data) == 1 and "points" in role_data
+               and same_value(role_data["points"], archived_points(role_data["points"] or 0))
+               for role_data in value.values()):
+            return []
+        prefix = f"results[{index}]"
+        flatten_result(value, prefix, original)
+        archived = {f"{prefix}.{role}.points": archived_points(role_data.get("points") or 0)
+                    for role, role_data in value.items() if isinstance(role_data, dict)}
+        return [path for path in original.keys() | archived.keys()
+                if path not in original or path not in archived or not same_value(original[path], archived[path])]
+
+    flatten_result(value, key if index is None else f"{key}[{index}]", original)
+    return list(original)
+
+
+def file_stamp(path: Path) -> list[int]:
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def current_files(manifest: dict[str, Any], paths: dict[str, Path]) -> set[str]:
+    # Archived files still present with the size and mtime they had when compacted; an edited
+    # file no longer matches, so it is read from results/ until the next compact re-archives it
+    current = set()
+    for name, stamp in manifest["files"].items():
+        try:
+            if name in paths and file_stamp(paths[name]) == stamp:
+                current.add(name)
+        except OSError:
+            pass
+    return current
+
+
+def write_archive(archive_dir: Path, results: list[tuple[str, Iterable[tuple]]], loose_columns: dict[str, list[str]],
+                  stamps: dict[str, list[int]]):
+    strings: dict[str, list[str]] = {name: [] for name in STRING_COLUMNS}
+    codes: dict[str, dict[str, int]] = {name: {} for name in STRING_COLUMNS}
+    columns = {name: array("I") for name in STRING_COLUMNS}
+    columns["timestamp"] = array("q")
+    columns["round"] = array("I")
+    points = []
+    floats = array("B")
+
+    for name, records in results:
+        timestamp = submission_timestamp(name.removesuffix(".json"))
+        for record in records:
+            for column, value in zip(STRING_COLUMNS, record[:3]):
+                code = codes[column].get(value)
+                if code is None:
+                    code = codes[column][value] = len(strings[column])
+                    strings[column].append(value)
+                columns[column].append(code)
+            columns["timestamp"].append(timestamp)
+            columns["round"].append(record[3])
+            value = archived_points(record[4])
+            points.append(value)
+            floats.append(isinstance(value, float))
+
+    # Integer points stay integers when other files have float points
+    if any(floats):
+        columns["points"] = array("d", points)
+        columns["points_float"] = floats
+    else:
+        columns["points"] = array("q", points)
+
+    tmp_dir = archive_dir.with_name(archive_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for column, values in columns.items():
+        with open(tmp_dir / f"{column}.bin", "wb") as f:
+            values.tofile(f)
+
+    manifest = {
+        "version": ARCHIVE_VERSION,
+        "byteorder": sys.byteorder,
+        "rows": len(points),
+        "files": {name: stamps[name] for name, _ in results},
+        "types": {column: values.typecode for column, values in columns.items()},
+        "strings": strings,
+        "loose_columns": {name: sorted(paths) for name, paths in loose_columns.items() if paths},
+    }
+    (tmp_dir / MANIFEST_PATH).write_text(json.dumps(manifest) + "\n")
+
+    old_dir = archive_dir.with_name(archive_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if archive_dir.exists():
+        os.replace(archive_dir, old_dir)
+    os.replace(tmp_dir, archive_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def load_manifest(archive_dir: Path) -> dict[str, Any] | None:
+    path = archive_dir / MANIFEST_PATH
+    if not path.exists():
+        return None
+    manifest = json.loads(path.read_text())
+    if manifest.get("version") != ARCHIVE_VERSION:
+        print(f"Error: {archive_dir} has unsupported archive version {manifest.get('version')}, run compact --full")
+        sys.exit(1)
+    return manifest
+
+
+def read_archive(archive_dir: Path) -> tuple[dict[str, Any], dict[str, array]] | None:
+    manifest = load_manifest(archive_dir)
+    if manifest is None:
+        return None
+
+    columns = {}
+    for column, typecode in manifest["types"].items():
+        values = array(typecode)
+        with open(archive_dir / f"{column}.bin", "rb") as f:
+            values.frombytes(f.read())
+        if manifest["byteorder"] != sys.byteorder:
+            values.byteswap()
+        columns[column] = values
+    return manifest, columns
+
+
+def load_archived_results(archive_dir: Path, paths: dict[str, Path]) -> tuple[dict[str, dict[str, Any]], dict[str, list[str]]]:
+    # Results rebuilt from the columns, plus the flattened paths of each file the archive does not hold,
+    # for the files in paths that are unchanged since they were archived
+    archive = read_archive(archive_dir)
+    if archive is None:
+        return {}, {}
+    manifest, columns = archive
+    strings = manifest["strings"]
+    current = current_files(manifest, paths)
+
+    points_column = columns["points"]
+    if "points_float" in columns:
+        points_column = [value if is_float else int(value) for value, is_float in zip(points_column, columns["points_float"])]
+
+    results: dict[str, dict[str, Any]] = {}
+    submissions, roles, agent_ids = (strings[name] for name in STRING_COLUMNS)
+    for submission, role, agent_id, round_no, points in zip(
+        columns["submission"], columns["role"], columns["agentbeats_id"], columns["round"], points_column
+    ):
+        result = results.get(submission)
+        if result is None:
+            result = results[submission] = {"participants": {}, "results": []}
+        role_name = roles[role]
+        if agent_ids[agent_id] is not None:
+            result["participants"][role_name] = agent_ids[agent_id]
+        if round_no:
+            rounds = result["results"]
+            while len(rounds) < round_no:
+                rounds.append({})
+            rounds[round_no - 1][role_name] = {"points": points}
+
+    archived = {submissions[code] + ".json": result for code, result in results.items()}
+    loose_columns = manifest.get("loose_columns", {})
+    return ({name: result for name, result in archived.items() if name in current},
+            {name: columns for name, columns in loose_columns.items() if name in current})
+
+
+def iter_results(results_dir: Path, state_dir: Path, needed: set[str] | None = frozenset()):
+    # Archived files are served from the archive, everything else is read loose. So is an
+    # archived file with any needed column the archive does not hold (None: all columns).
+    # participants and points, which the materialized state uses, are always archived
+    paths = {path.name: path for path in results_dir.glob("*.json")}
+    archived, loose_columns = load_archived_results(state_dir / ARCHIVE_DIR, paths)
+
+    for name in sorted(paths):
+        result = archived.get(name)
+        unarchived = loose_columns.get(name)
+        if unarchived and (needed is None or needed.intersection(unarchived)):
+            result = None
+        if result is None:
+            result = json.loads(paths[name].read_text())
+        yield name, result
+
+
+def load_columns(results_dir: Path, state_dir: Path, needed: set[str] | None = frozenset()) -> dict[str, list]:
+    columns: dict[str, list] = {}
+    count = 0
+
+    for _, result in iter_results(results_dir, state_dir, needed):
+        row: dict[str, Any] = {}
+        flatten_result(result, "", row)
+
+        for name, value in row.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [None] * count
+            column.append(value)
+        count += 1
+
+        for column in columns.values():
+            if len(column) < count:
+                column.append(None)
+
+    return columns
+
+
+def referenced_columns(sql: str) -> set[str]:
+    return {root + path for root, path in PATH_PATTERN.findall(sql)}
+
+
+def rewrite_query(sql: str) -> str:
+    return PATH_PATTERN.sub(lambda m: '"' + m.group(0) + '"', sql)
+
+
+def open_database(columns: dict[str, list], extra_columns: set[str] = frozenset()) -> sqlite3.Connection:
+    names = list(columns) + sorted(set(extra_columns) - set(columns))
+    row_count = len(next(iter(columns.values()), []))
+
+    conn = sqlite3.connect(":memory:")
+    column_defs = ", ".join(f'"{name}"' for name in names) or '"_empty"'
+    conn.execute(f"CREATE TABLE {TABLE_NAME} ({column_defs})")
+
+    if names and row_count:
+        data = [columns.get(name, [None] * row_count) for name in names]
+        placeholders = ", ".join("?" for _ in names)
+        conn.executemany(f"INSERT INTO {TABLE_NAME} VALUES ({placeholders})", zip(*data))
+
+    return conn
+
+
+def load_queries(queries_path: Path) -> list[dict[str, str]]:
+    return json.loads(queries_path.read_text())
+
+
+def run_query(conn: sqlite3.Connection, sql: str) -> tuple[list[str], list[tuple]]:
+    cursor = conn.execute(rewrite_query(sql))
+    header = [d[0] for d in cursor.description or []]
+    return header, cursor.fetchall()
+
+
+def format_table(header: list[str], rows: list[tuple]) -> str:
+    cells = [header] + [["" if v is None else str(v) for v in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+
+    lines = []
+    for index, row in enumerate(cells):
+        lines.append("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+        if index == 0:
+            lines.append("  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def result_points(result: dict[str, Any]) -> list[tuple[str, int]]:
+    # Mirrors the "By points" query: points of each role in the first round
+    participants = result.get("participants", {})
+    rounds = result.get("results", [])
+    first_round = rounds[0] if rounds else {}
+
+    entries = []
+    for role, agent_id in participants.items():
+        points = first_round.get(role, {}).get("points")
+        entries.append((agent_id, points or 0))
+    return entries
+
+
+def legacy_state(state_dir: Path) -> dict[str, Any]:
+    points_path = state_dir / LEGACY_POINTS_PATH
+    ingested_path = state_dir / LEGACY_INGESTED_PATH
+    return {
+        "points": json.loads(points_path.read_text()) if points_path.exists() else {},
+        "ingested": sorted(set(ingested_path.read_text().split())) if ingested_path.exists() else [],
+    }
+
+
+def load_state(state_dir: Path) -> dict[str, Any]:
+    path = state_dir / STATE_PATH
+    if not path.exists():
+        return legacy_state(state_dir)
+    return json.loads(path.read_text())
+
+
+def load_points(state_dir: Path) -> dict[str, int]:
+    return load_state(state_dir)["points"]
+
+
+def load_ingested(state_dir: Path) -> set[str]:
+    return set(load_state(state_dir)["ingested"])
+
+
+def locked_state(state_dir: Path):
+    return atomic_files.locked_json(state_dir / STATE_PATH, lambda: legacy_state(state_dir))
+
+
+def agent_index_entries(name: str, result: dict[str, Any]) -> list[tuple[str, list]]:
+    rounds_by_role: dict[str, list[int]] = {}
+    for round_no, round_data in enumerate(result.get("results", []), start=1):
+        for role in round_data:
+            rounds_by_role.setdefault(role, []).append(round_no)
+
+    entries = []
+    for role, agent_id in result.get("participants", {}).items():
+        entries.append((agent_id, [name, role, rounds_by_role.get(role, [])]))
+    return entries
+
+
+def agent_index_path(state_dir: Path, agent_id: str) -> Path:
+    if not AGENT_FILE_NAME.match(agent_id):
+        agent_id = hashlib.sha256(agent_id.encode()).hexdigest()
+    return state_dir / AGENTS_DIR / f"{agent_id}.jsonl"
+
+
+def load_agent_index(state_dir: Path, agent_id: str) -> list[list]:
+    path = agent_index_path(state_dir, agent_id)
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines() if line]
+
+
+def append_agent_index(state_dir: Path, entries: list[tuple[str, list]]):
+    (state_dir / AGENTS_DIR).mkdir(parents=True, exist_ok=True)
+    by_agent: dict[str, list[list]] = {}
+    for agent_id, entry in entries:
+        by_agent.setdefault(agent_id, []).append(entry)
+    for agent_id, agent_entries in by_agent.items():
+        with open(agent_index_path(state_dir, agent_id), "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in agent_entries)
+
+
+def write_agent_index(state_dir: Path, entries: list[tuple[str, list]]):
+    shutil.rmtree(state_dir / AGENTS_DIR, ignore_errors=True)
+    append_agent_index(state_dir, entries)
+
+
+def read_agent_index(state_dir: Path) -> Counter:
+    indexed = Counter()
+    agents_dir = state_dir / AGENTS_DIR
+    if agents_dir.exists():
+        for path in agents_dir.glob("*.jsonl"):
+            indexed.update((path.name, line) for line in path.read_text().splitlines() if line)
+    return indexed
+
+
+def scan_result_file(path: Path) -> tuple[list[tuple[str, Any]], list[tuple[str, list]]]:
+    # Exactly result_points and agent_index_entries, from one streaming pass over the file:
+    # every role of the participants map counts, including those with an empty ID
+    participants: dict[str, str] = {}
+    first_round: dict[str, Any] = {}
+    rounds_by_role: dict[str, list[int]] = {}
+    with open(path) as f:
+        for key, round_no, value in result_stream.iter_items(f):
+            if key == "participants":
+                participants = value
+            elif key == "results" and round_no is not None:
+                if round_no == 1:
+                    first_round = value
+                for role in value:
+                    rounds_by_role.setdefault(role, []).append(round_no)
+
+    points = [(agent_id, first_round.get(role, {}).get("points") or 0) for role, agent_id in participants.items()]
+    index_entries = [(agent_id, [path.name, role, rounds_by_role.get(role, [])])
+                     for role, agent_id in participants.items()]
+    return points, index_entries
+
+
+def ingest_results(state_dir: Path, paths: list[Path]) -> list[Path]:
+    # Points and ingested names change together under the state lock, so a crash or a concurrent
+    # ingest cannot count a file twice. The agent index is appended only once that has committed;
+    # if it is interrupted, history --verify reports the gap and rebuild fills it
+    added = []
+    index_entries = []
+    with locked_state(state_dir) as state:
+        points = state["points"]
+        ingested = set(state["ingested"])
+        for path in paths:
+            if path.name in ingested:
+                continue
+            file_points, file_index = scan_result_file(path)
+            for agent_id, value in file_points:
+                points[agent_id] = points.get(agent_id, 0) + value
+            index_entries.extend(file_index)
+            ingested.add(path.name)
+            added.append(path)
+        state["ingested"] = sorted(ingested)
+
+    if added:
+        append_agent_index(state_dir, index_entries)
+    return added
+
+
+def recompute_state(results_dir: Path, state_dir: Path) -> tuple[dict[str, int], set[str], list[tuple[str, list]]]:
+    points: dict[str, int] = {}
+    names = set()
+    index_entries = []
+    for name, result in iter_results(results_dir, state_dir):
+        for agent_id, value in result_points(result):
+            points[agent_id] = points.get(agent_id, 0) + value
+        index_entries.extend(agent_index_entries(name, result))
+        names.add(name)
+    return points, names, index_entries
+
+
+def rank_points(points: dict[str, int]) -> list[tuple[str, int]]:
+    return sorted(points.items(), key=lambda item: (-item[1], item[0]))
+
+
+def add_moments(totals: dict[Any, list[float]], key: Any, count: int, total: float, squares: float):
+    moments = totals.get(key)
+    if moments is None:
+        totals[key] = [count, total, squares]
+    else:
+        moments[0] += count
+        moments[1] += total
+        moments[2] += squares
+
+
+def round_moments(results_dir: Path, state_dir: Path, by_submission: bool = False) -> dict[Any, list[float]]:
+    # Count, sum and sum of squares of round points per agent (or per submission and agent).
+    # Archived rows are folded straight from the typed columns without rebuilding any JSON.
+    paths = {path.name: path for path in results_dir.glob("*.json")}
+    totals: dict[Any, list[float]] = {}
+    archived = set()
+
+    archive = read_archive(state_dir / ARCHIVE_DIR)
+    if archive is not None:
+        manifest, columns = archive
+        submissions, _, agent_ids = (manifest["strings"][name] for name in STRING_COLUMNS)
+        archived = current_files(manifest, paths)
+        live = [submission + ".json" in archived for submission in submissions]
+        agent_count = len(agent_ids)
+
+        counts, sums, squares = Counter(), Counter(), Counter()
+        for submission, agent, round_no, points in zip(
+            columns["submission"], columns["agentbeats_id"], columns["round"], columns["points"]
+        ):
+            if round_no and live[submission]:
+                key = submission * agent_count + agent if by_submission else agent
+                counts[key] += 1
+                sums[key] += points
+                squares[key] += points * points
+
+        for key, count in counts.items():
+            agent_id = agent_ids[key % agent_count]
+            if agent_id:
+                name = (submissions[key // agent_count], agent_id) if by_submission else agent_id
+                add_moments(totals, name, count, sums[key], squares[key])
+
+    for name in sorted(paths.keys() - archived):
+        for submission, _, agent_id, round_no, points in result_stream.iter_result_records(results_dir / name):
+            if round_no and agent_id:
+                add_moments(totals, (submission, agent_id) if by_submission else agent_id, 1, points, points * points)
+
+    return totals
+
+
+def summarize_moments(count: int, total: float, squares: float) -> tuple[float, float, float]:
+    # Mean, sample standard deviation and half-width of the 95% confidence interval
+    mean = total / count
+    if count < 2:
+        return mean, 0.0, math.inf
+    stddev = math.sqrt(max(0.0, (squares - total * mean) / (count - 1)))
+    critical = T_CRITICAL_95[count - 2] if count - 1 <= len(T_CRITICAL_95) else Z_CRITICAL_95
+    return mean, stddev, critical * stddev / math.sqrt(count)
+
+
+def cmd_query(args):
+    if not args.queries.exists():
+        print(f"Error: {args.queries} not found")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    queries = load_queries(args.queries)
+    if args.name:
+        queries = [q for q in queries if q["name"] == args.name]
+        if not queries:
+            print(f"Error: no query named '{args.name}' in {args.queries}")
+            sys.exit(1)
+
+    needed = set().union(*(referenced_columns(q["query"]) for q in queries))
+    wildcard = any(WILDCARD_PATTERN.search(q["query"]) for q in queries)
+    columns = load_columns(args.results, args.state, None if wildcard else needed)
+    conn = open_database(columns, needed)
+    loaded = time.perf_counter()
+
+    output = []
+    for query in queries:
+        header, rows = run_query(conn, query["query"])
+        if args.json:
+            output.append({"name": query["name"], "rows": [dict(zip(header, row)) for row in rows]})
+        else:
+            print(f"## {query['name']}")
+            print(format_table(header, rows))
+            print()
+
+    if args.json:
+        print(json.dumps(output, indent=2))
+
+    if args.verbose:
+        done = time.perf_counter()
+        row_count = len(next(iter(columns.values()), []))
+        print(f"Loaded {row_count} results in {loaded - start:.3f}s, "
+              f"ran {len(queries)} queries in {done - loaded:.3f}s", file=sys.stderr)
+
+
+def cmd_ingest(args):
+    if args.files:
+        paths = args.files
+    else:
+        ingested = load_ingested(args.state)
+        paths = [p for p in sorted(args.results.glob("*.json")) if p.name not in ingested]
+
+    for path in paths:
+        if not path.exists():
+            print(f"Error: {path} not found")
+            sys.exit(1)
+
+    added = ingest_results(args.state, paths)
+    print(f"Ingested {len(added)} result file(s) into {args.state}")
+
+
+def cmd_points(args):
+    ranked = rank_points(load_points(args.state))
+    if args.json:
+        print(json.dumps([{"id": agent_id, "Points": value} for agent_id, value in ranked], indent=2))
+    else:
+        print(format_table(["id", "Points"], ranked))
+
+
+def cmd_rebuild(args):
+    points, names, index_entries = recompute_state(args.results, args.state)
+
+    if args.check:
+        stored_points = load_points(args.state)
+        stored_names = load_ingested(args.state)
+        ok = True
+        for agent_id in sorted(set(points) | set(stored_points)):
+            if points.get(agent_id) != stored_points.get(agent_id):
+                print(f"Mismatch for {agent_id}: stored {stored_points.get(agent_id)}, recomputed {points.get(agent_id)}")
+                ok = False
+        for name in sorted(names - stored_names):
+            print(f"Not ingested: {name}")
+            ok = False
+        for name in sorted(stored_names - names):
+            print(f"Ingested but missing from {args.results}: {name}")
+            ok = False
+        if not ok:
+            sys.exit(1)
+        print(f"Materialized points match a full recompute ({len(points)} agents, {len(names)} files)")
+        return
+
+    with locked_state(args.state) as state:
+        state.update(points=points, ingested=sorted(names))
+    write_agent_index(args.state, index_entries)
+    print(f"Rebuilt {args.state} from {len(names)} result file(s)")
+
+
+def cmd_history(args):
+    if args.verify:
+        _, _, index_entries = recompute_state(args.results, args.state)
+        expected = Counter(
+            (agent_index_path(args.state, agent_id).name, json.dumps(entry))
+            for agent_id, entry in index_entries
+        )
+        indexed = read_agent_index(args.state)
+        for file_name, line in sorted(expected - indexed):
+            print(f"Missing from index: {file_name.removesuffix('.jsonl')} {line}")
+        for file_name, line in sorted(indexed - expected):
+            print(f"Stale index entry: {file_name.removesuffix('.jsonl')} {line}")
+        if expected != indexed:
+            sys.exit(1)
+        print(f"Agent index matches {args.results} ({len(expected)} entries)")
+        return
+
+    if not args.agent_id:
+        print("Error: agent_id is required unless --verify is given")
+        sys.exit(1)
+
+    rows = []
+    for name, role, rounds in load_agent_index(args.state, args.agent_id):
+        path = args.results / name
+        if not path.exists():
+            print(f"Warning: {path} is indexed but missing, run history --verify", file=sys.stderr)
+            continue
+        if not rounds:
+            continue
+        wanted = set(rounds)
+        for round_no, round_data in result_stream.iter_rounds(path, max(rounds)):
+            if round_no in wanted:
+                rows.append((name.removesuffix(".json"), role, round_no, round_data.get(role, {}).get("points")))
+
+    if args.json:
+        print(json.dumps([dict(zip(("submission", "role", "round", "points"), row)) for row in rows], indent=2))
+    else:
+        print(format_table(["submission", "role", "round", "points"], rows))
+        total = sum(row[3] or 0 for row in rows if row[2] == 1)
+        print(f"\n{len(rows)} round(s) across {len({row[0] for row in rows})} submission(s), {total} leaderboard points")
+
+
+def cmd_stats(args):
+    by_submission = args.by == "submission"
+    rows = []
+    for key, (count, total, squares) in round_moments(args.results, args.state, by_submission).items():
+        mean, stddev, margin = summarize_moments(count, total, squares)
+        rows.append((*(key if by_submission else (key,)), count, mean, stddev, mean - margin, mean + margin))
+    rows.sort(key=lambda row: (-row[-4], row[:-5]))
+
+    header = (["submission"] if by_submission else []) + ["id", "rounds", "mean", "stddev", "ci95_low", "ci95_high"]
+    if args.json:
+        print(json.dumps([
+            dict(zip(header, (None if isinstance(v, float) and math.isinf(v) else v for v in row))) for row in rows
+        ], indent=2))
+    else:
+        print(format_table(header, [
+            (*row[:-4], *(f"{v:.3f}" for v in row[-4:])) for row in rows
+        ]))
+
+
+def cmd_compact(args):
+    archive_dir = args.state / ARCHIVE_DIR
+    paths = {path.name: path for path in args.results.glob("*.json")}
+
+    # Stamped before reading, so a file edited while it is being compacted is re-read next time
+    stamps = {name: file_stamp(path) for name, path in paths.items()}
+    archived, loose_columns = ({}, {}) if args.full else load_archived_results(archive_dir, paths)
+    loose = [name for name in paths if name not in archived]
+
+    results = []
+    unarchived: dict[str, list[str]] = {}
+    for name in sorted(paths):
+        submission = name.removesuffix(".json")
+        if name in archived:
+            results.append((name, result_records(submission, archived[name])))
+            unarchived[name] = loose_columns.get(name, [])
+        else:
+            file_paths = unarchived[name] = []
+
+            def visit(key, index, value, file_paths=file_paths):
+                file_paths.extend(unarchived_paths(key, index, value))
+            results.append((name, result_stream.iter_result_records(paths[name], submission, visit=visit)))
+
+    write_archive(archive_dir, results, unarchived, stamps)
+    print(f"Compacted {len(results)} result file(s) into {archive_dir} ({len(loose)} added or changed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate leaderboard queries against local results")
+    parser.add_argument("--results", type=Path, default=Path(RESULTS_DIR))
+    parser.add_argument("--state", type=Path, default=Path(STATE_DIR), help="Directory for materialized state")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="Run queries.json against results/*.json")
+    query_parser.add_argument("--queries", type=Path, default=Path(QUERIES_PATH))
+    query_parser.add_argument("--name", help="Only run the query with this name")
+    query_parser.add_argument("--json", action="store_true", help="Print rows as JSON")
+    query_parser.add_argument("-v", "--verbose", action="store_true", help="Report load and query timings")
+    query_parser.set_defaults(func=cmd_query)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Add result files to the materialized points table")
+    ingest_parser.add_argument("files", nargs="*", type=Path, help="Result files (default: all not yet ingested)")
+    ingest_parser.set_defaults(func=cmd_ingest)
+
+    points_parser = subparsers.add_parser("points", help="Print the materialized \"By points\" leaderboard")
+    points_parser.add_argument("--json", action="store_true", help="Print rows as JSON")
+    points_parser.set_defaults(func=cmd_points)
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Recompute materialized state from all result files")
+    rebuild_parser.add_argument("--check", action="store_true", help="Only compare stored state with a full recompute")
+    rebuild_parser.set_defaults(func=cmd_rebuild)
+
+    history_parser = subparsers.add_parser("history", help="Show every indexed run of an agent")
+    history_parser.add_argument("agent_id", nargs="?")
+    history_parser.add_argument("--json", action="store_true", help="Print rows as JSON")
+    history_parser.add_argument("--verify", action="store_true", help="Check the agent index against all result files")
+    history_parser.set_defaults(func=cmd_history)
+
+    stats_parser = subparsers.add_parser("stats", help="Mean, stddev and 95%% confidence interval of round points")
+    stats_parser.add_argument("--by", choices=("agent", "submission"), default="agent",
+                              help="Aggregate every round of an agent, or each submission's rounds separately")
+    stats_parser.add_argument("--json", action="store_true", help="Print rows as JSON")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    compact_parser = subparsers.add_parser("compact", help="Pack result files into a columnar archive")
+    compact_parser.add_argument("--full", action="store_true", help="Re-read every result file instead of reusing the archive")
+    compact_parser.set_defaults(func=cmd_compact)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Record monotonic phase spans of an assessment run in output/timings.json"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import atomic_files
+
+TIMINGS_PATH = "output/timings.json"
+POLL_INTERVAL = 0.5
+
+CLIENT_SERVICE = "agentbeats-client"
+GREEN_SERVICE = "green-agent"
+UNHEALTHCHECKED_SERVICES = (CLIENT_SERVICE, "startup-gate")
+
+# Green agent log line that marks the CTF VM as reachable over SSH
+DEFAULT_VM_READY_PATTERN = r"(?i)\bssh\b.*\b(up|ready|reachable)\b"
+
+UP_ARGS = ["--exit-code-from", CLIENT_SERVICE, "--abort-on-container-exit"]
+
+
+def load_timings(path: Path) -> dict[str, Any]:
+    if path.exists():
+        return json.loads(path.read_text())
+    # The anchor converts monotonic span times to wall-clock time
+    return {"clock": "monotonic", "anchor": {"monotonic": time.monotonic(), "unix": time.time()}, "spans": []}
+
+
+def record_spans(path: Path, spans: list[dict[str, Any]]):
+    timings = load_timings(path)
+    timings["spans"].extend(spans)
+    atomic_files.write_atomic(path, json.dumps(timings, indent=2) + "\n")
+
+
+def span(phase: str, start: float, end: float, **details) -> dict[str, Any]:
+    record = {"phase": phase, "start": round(start, 3), "end": round(end, 3), "seconds": round(end - start, 3)}
+    if details:
+        record["details"] = details
+    return record
+
+
+def compose_services(compose_args: list[str]) -> list[str]:
+    result = subprocess.run(["docker", "compose", *compose_args, "config", "--services"],
+                            capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def compose_ps(compose_args: list[str]) -> list[dict[str, Any]]:
+    result = subprocess.run(["docker", "compose", *compose_args, "ps", "--all", "--format", "json"],
+                            capture_output=True, text=True)
+    if result.returncode or not result.stdout.strip():
+        return []
+    # Older compose releases print one array, newer ones one object per line
+    output = result.stdout.strip()
+    if output.startswith("["):
+        return json.loads(output)
+    return [json.loads(line) for line in output.splitlines() if line.strip()]
+
+
+def watch_logs(compose_args: list[str], service: str, pattern: re.Pattern, found: dict[str, float],
+               stop: threading.Event):
+    process = subprocess.Popen(["docker", "compose", *compose_args, "logs", "--follow", "--no-color", service],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in process.stdout:
+            if pattern.search(line):
+                found["at"] = time.monotonic()
+                return
+            if stop.is_set():
+                return
+    finally:
+        process.kill()
+        process.wait()
+
+
+def run_compose(compose_args: list[str], up_args: list[str], vm_ready_pattern: str) -> tuple[int, list[dict[str, Any]]]:
+    # Phases are observed by polling docker compose ps, so their edges are accurate to POLL_INTERVAL
+    services = compose_services(compose_args)
+    healthchecked = [s for s in services if s not in UNHEALTHCHECKED_SERVICES]
+    started: dict[str, float] = {}
+    healthy: dict[str, float] = {}
+    exited: dict[str, float] = {}
+    vm_ready: dict[str, float] = {}
+    stop = threading.Event()
+    log_thread = None
+
+    start = time.monotonic()
+    process = subprocess.Popen(["docker", "compose", *compose_args, "up", *up_args])
+    while True:
+        running = process.poll() is None
+        now = time.monotonic()
+        for container in compose_ps(compose_args):
+            service = container.get("Service")
+            state = container.get("State")
+            if state in ("running", "exited", "dead"):
+                started.setdefault(service, now)
+            if container.get("Health") == "healthy":
+                healthy.setdefault(service, now)
+            if state in ("exited", "dead"):
+                exited.setdefault(service, now)
+        if log_thread is None and GREEN_SERVICE in started:
+            log_thread = threading.Thread(
+                target=watch_logs,
+                args=(compose_args, GREEN_SERVICE, re.compile(vm_ready_pattern), vm_ready, stop),
+                daemon=True,
+            )
+            log_thread.start()
+        if not running:
+            break
+        time.sleep(POLL_INTERVAL)
+    end = time.monotonic()
+    stop.set()
+
+    def offsets(moments):
+        return {service: round(moment - start, 3) for service, moment in sorted(moments.items())}
+
+    spans = [span("compose.up", start, end, exit_code=process.returncode)]
+    if started and all(s in started for s in services):
+        spans.append(span("compose.start", start, max(started.values()), services=offsets(started)))
+    if healthchecked and all(s in healthy for s in healthchecked):
+        spans.append(span("compose.healthy", start, max(healthy[s] for s in healthchecked), services=offsets(healthy)))
+    if GREEN_SERVICE in started and "at" in vm_ready:
+        spans.append(span("vm.boot", started[GREEN_SERVICE], vm_ready["at"]))
+    if CLIENT_SERVICE in started:
+        spans.append(span("assessment", started[CLIENT_SERVICE], exited.get(CLIENT_SERVICE, end)))
+    return process.returncode, spans
+
+
+def summarize(paths: list[Path]) -> list[tuple[str, int, float, float]]:
+    from readiness import percentile
+
+    samples: dict[str, list[float]] = {}
+    for path in paths:
+        for record in json.loads(path.read_text()).get("spans", []):
+            samples.setdefault(record["phase"], []).append(record["seconds"])
+    return [(phase, len(values), percentile(values, 0.5), percentile(values, 0.95))
+            for phase, values in sorted(samples.items())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the phases of an assessment run")
+    parser.add_argument("--timings", type=Path, default=Path(TIMINGS_PATH))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a command and record it as one phase")
+    run_parser.add_argument("phase")
+    run_parser.add_argument("cmd", nargs=argparse.REMAINDER, help="-- command and arguments")
+
+    compose_parser = subparsers.add_parser("compose", help="docker compose up with start/healthy/VM/assessment phases")
+    compose_parser.add_argument("--project-dir", help="Passed to docker compose as --project-directory")
+    compose_parser.add_argument("--vm-ready-pattern", default=DEFAULT_VM_READY_PATTERN,
+                                help="Regex on green agent log lines that marks the end of the VM boot")
+    compose_parser.add_argument("up_args", nargs=argparse.REMAINDER,
+                                help=f"-- arguments for docker compose up (default: {' '.join(UP_ARGS)})")
+
+    report_parser = subparsers.add_parser("report", help="p50/p95 per phase over many timings files")
+    report_parser.add_argument("files", nargs="+", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        missing = [str(path) for path in args.files if not path.exists()]
+        if missing:
+            print(f"Error: {', '.join(missing)} not found")
+            sys.exit(1)
+        rows = summarize(args.files)
+        print(f"{'phase':<20}{'runs':>6}{'p50':>10}{'p95':>10}")
+        for phase, count, p50, p95 in rows:
+            print(f"{phase:<20}{count:>6}{p50:>9.2f}s{p95:>9.2f}s")
+        return
+
+    try:
+        if args.command == "run":
+            cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+            if not cmd:
+                print("Error: no command given")
+                sys.exit(1)
+            start = time.monotonic()
+            returncode = subprocess.run(cmd).returncode
+            record_spans(args.timings, [span(args.phase, start, time.monotonic(), exit_code=returncode)])
+        else:
+            up_args = args.up_args[1:] if args.up_args[:1] == ["--"] else args.up_args
+            compose_args = ["--project-directory", args.project_dir] if args.project_dir else []
+            returncode, spans = run_compose(compose_args, up_args or UP_ARGS, args.vm_ready_pattern)
+            record_spans(args.timings, spans)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    sys.exit(returncode)
+
+if __name__ == "__main__":
+    main()
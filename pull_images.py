@@ -0,0 +1,63 @@
+"""Pull the unique images of a pull plan concurrently before docker compose up"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+
+def pull_image(entry: dict[str, Any]) -> tuple[str, float, str | None]:
+    command = ["docker", "pull", "--quiet"]
+    if entry.get("platform"):
+        command += ["--platform", entry["platform"]]
+    command.append(entry["image"])
+
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError as e:
+        return entry["image"], time.perf_counter() - start, str(e)
+
+    error = None
+    if result.returncode:
+        error = result.stderr.strip() or f"exit code {result.returncode}"
+    return entry["image"], time.perf_counter() - start, error
+
+
+def pull_plan(plan: dict[str, Any], concurrency: int | None = None) -> list[tuple[str, float, str | None]]:
+    workers = max(1, concurrency or plan.get("concurrency") or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(pull_image, plan["images"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pull the images of a generate_compose.py pull plan in parallel")
+    parser.add_argument("plan", type=Path)
+    parser.add_argument("--concurrency", type=int, help="Override the plan's suggested concurrency")
+    args = parser.parse_args()
+
+    if not args.plan.exists():
+        print(f"Error: {args.plan} not found")
+        sys.exit(1)
+
+    plan = json.loads(args.plan.read_text())
+    start = time.perf_counter()
+    outcomes = pull_plan(plan, args.concurrency)
+    elapsed = time.perf_counter() - start
+
+    for image, seconds, error in outcomes:
+        print(f"{'FAILED' if error else 'pulled':<7} {image} in {seconds:.1f}s")
+        if error:
+            print(f"        {error}")
+
+    failed = sum(1 for _, _, error in outcomes if error)
+    services = sum(len(entry["services"]) for entry in plan["images"])
+    print(f"Pulled {len(outcomes) - failed}/{len(outcomes)} unique image(s) for {services} service(s) in {elapsed:.1f}s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Poll agent readiness from outside the containers and keep time-to-ready history"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import atomic_files
+import generate_compose
+
+
+HISTORY_PATH = ".readiness/history.json"
+HISTORY_LIMIT = 50
+
+AGENT_CARD_PATH = "/.well-known/agent-card.json"
+DEFAULT_TIMEOUT = 300
+
+# Back off exponentially while a service is clearly still booting, then poll
+# fast once it gets close to the time-to-ready seen for its image before
+INITIAL_DELAY = 0.05
+MAX_DELAY = 2.0
+FAST_DELAY = 0.1
+FAST_WINDOW = 0.7
+PROBE_TIMEOUT = 2.0
+
+
+def load_history(path: Path) -> dict[str, list[float]]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_history(path: Path, history: dict[str, list[float]]):
+    atomic_files.write_atomic(path, json.dumps(history, indent=2, sort_keys=True) + "\n")
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def healthcheck_params(history: dict[str, list[float]]) -> dict[str, dict[str, Any]]:
+    # A 1s interval bounds the wait after readiness; start_period covers the slow tail
+    params = {}
+    for image, samples in history.items():
+        if not samples:
+            continue
+        p95 = percentile(samples, 0.95)
+        params[image] = {
+            "interval": "1s",
+            "timeout": "2s",
+            "retries": 10,
+            "start_period": f"{math.ceil(p95 * 1.5) + 5}s",
+        }
+    return params
+
+
+def next_delay(delay: float, elapsed: float, expected: float | None) -> float:
+    if expected is None:
+        return min(MAX_DELAY, delay * 2)
+    fast_from = expected * FAST_WINDOW
+    if elapsed >= fast_from:
+        return FAST_DELAY
+    return max(FAST_DELAY, min(MAX_DELAY, delay * 2, fast_from - elapsed))
+
+
+async def probe(host: str, port: int) -> bool:
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), PROBE_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(f"GET {AGENT_CARD_PATH} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), PROBE_TIMEOUT)
+        parts = status_line.split()
+        return len(parts) > 1 and parts[1].startswith(b"2")
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+def parse_docker_time(value: str) -> float | None:
+    if not value or value.startswith("0001-"):
+        return None
+    # Docker reports nanoseconds; datetime takes at most microseconds
+    head, _, fraction = value.rstrip("Z").partition(".")
+    moment = datetime.fromisoformat(f"{head}.{(fraction or '0')[:6]}+00:00")
+    return moment.timestamp()
+
+
+async def inspect_container(container: str) -> tuple[str | None, float | None]:
+    process = await asyncio.create_subprocess_exec(
+        "docker", "inspect", "-f",
+        "{{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}|{{.State.StartedAt}}",
+        container,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None, None
+    addresses, _, started = stdout.decode().strip().partition("|")
+    address = next(iter(addresses.split()), None)
+    return address, parse_docker_time(started)
+
+
+async def wait_for_service(container: str, port: int, expected: float | None, deadline: float) -> float | None:
+    poll_start = time.time()
+    started_at = None
+    address = None
+    delay = INITIAL_DELAY
+
+    while time.time() < deadline:
+        if address is None:
+            address, started_at = await inspect_container(container)
+        if address and await probe(address, port):
+            return time.time() - (started_at or poll_start)
+        elapsed = time.time() - (started_at or poll_start)
+        delay = next_delay(delay, elapsed, expected)
+        await asyncio.sleep(delay)
+    return None
+
+
+async def wait_for_services(targets: list[dict[str, Any]], history: dict[str, list[float]],
+                            timeout: float) -> dict[str, float | None]:
+    deadline = time.time() + timeout
+    tasks = []
+    for target in targets:
+        samples = history.get(target["image"])
+        expected = percentile(samples, 0.5) if samples else None
+        tasks.append(wait_for_service(target["container"], target["port"], expected, deadline))
+    results = await asyncio.gather(*tasks)
+    return {target["service"]: result for target, result in zip(targets, results)}
+
+
+def scenario_targets(scenario: dict[str, Any], run_id: str | None, port: int) -> list[dict[str, Any]]:
+    prefix = f"{run_id}-" if run_id else ""
+    targets = [{"service": "green-agent", "image": scenario["green_agent"]["image"]}]
+    targets += [{"service": p["name"], "image": p["image"]} for p in scenario.get("participants", [])]
+    for target in targets:
+        target["container"] = prefix + target["service"]
+        target["port"] = port
+    return targets
+
+
+def cmd_wait(args):
+    if not args.scenario.exists():
+        print(f"Error: {args.scenario} not found")
+        sys.exit(1)
+
+    scenario = generate_compose.parse_scenario(args.scenario)
+    targets = scenario_targets(scenario, args.run_id, args.port)
+    history = load_history(args.history)
+
+    ready = asyncio.run(wait_for_services(targets, history, args.timeout))
+
+    for target in targets:
+        seconds = ready[target["service"]]
+        if seconds is None:
+            print(f"{target['service']:<24} not ready after {args.timeout}s")
+            continue
+        print(f"{target['service']:<24} ready after {seconds:.2f}s")
+        samples = history.setdefault(target["image"], [])
+        samples.append(round(seconds, 3))
+        del samples[:-HISTORY_LIMIT]
+
+    save_history(args.history, history)
+    if any(seconds is None for seconds in ready.values()):
+        sys.exit(1)
+
+
+def cmd_show(args):
+    history = load_history(args.history)
+    params = healthcheck_params(history)
+    for image, samples in sorted(history.items()):
+        if samples:
+            print(f"{image}\n  {len(samples)} run(s), p50 {percentile(samples, 0.5):.2f}s, "
+                  f"p95 {percentile(samples, 0.95):.2f}s -> healthcheck {json.dumps(params[image])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure agent time-to-ready and keep per-image history")
+    parser.add_argument("--history", type=Path, default=Path(HISTORY_PATH))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    wait_parser = subparsers.add_parser("wait", help="Poll every agent of a running scenario until it is ready")
+    wait_parser.add_argument("--scenario", type=Path, required=True)
+    wait_parser.add_argument("--run-id", help="Run ID the compose file was generated with")
+    wait_parser.add_argument("--port", type=int, default=generate_compose.DEFAULT_PORT)
+    wait_parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    wait_parser.set_defaults(func=cmd_wait)
+
+    show_parser = subparsers.add_parser("show", help="Print time-to-ready statistics and derived healthchecks")
+    show_parser.set_defaults(func=cmd_show)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Cache of assessment results keyed by image digests and the a2a scenario"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable
+
+import atomic_files
+import generate_compose
+from image_cache import docker
+
+
+CACHE_DIR = Path(os.environ.get("CTF_RESULT_CACHE", Path.home() / ".cache" / "ctf-leaderboard" / "results"))
+INDEX_PATH = "index.json"
+
+# Bump whenever the key derivation changes so old entries stop matching
+CACHE_VERSION = "1"
+
+CLIENT_SERVICE = "agentbeats-client"
+GREEN_SERVICE = "green_agent"
+
+
+def locked_index(cache_dir: Path):
+    return atomic_files.locked_json(cache_dir / INDEX_PATH)
+
+
+def image_repository(ref: str) -> str:
+    name = ref.split("@", 1)[0]
+    last = name.rsplit("/", 1)[-1]
+    return name[:len(name) - len(last)] + last.split(":", 1)[0]
+
+
+def resolve_digest(ref: str) -> str:
+    # The local image is what docker compose would run, so it wins over the registry tag
+    if "@" in ref:
+        return ref.split("@", 1)[1]
+
+    local = docker("image", "inspect", "--format", "{{json .RepoDigests}} {{.Id}}", ref, check=False)
+    if local.returncode == 0:
+        repo_digests, _, image_id = local.stdout.strip().partition(" ")
+        repository = image_repository(ref)
+        for repo_digest in json.loads(repo_digests) or []:
+            name, _, digest = repo_digest.partition("@")
+            if name == repository:
+                return digest
+        # Built locally and never pushed: the image ID is content-addressed too
+        return image_id
+
+    remote = docker("buildx", "imagetools", "inspect", "--format", "{{json .Manifest}}", ref, check=False)
+    if remote.returncode == 0:
+        return json.loads(remote.stdout)["digest"]
+    raise RuntimeError(f"Cannot resolve a digest for {ref}: {remote.stderr.strip() or local.stderr.strip()}")
+
+
+def scenario_hash(scenario: dict[str, Any]) -> str:
+    # Hash the a2a scenario's parsed content, so TOML formatting and key order do not matter
+    a2a = generate_compose.load_tomli().loads(generate_compose.generate_a2a_scenario(scenario))
+    return hashlib.sha256(json.dumps(a2a, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def cache_key(scenario: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    # Env tables are part of the key as written; ${VAR} references stay unresolved, so secrets never are
+    green = scenario["green_agent"]
+    services = {GREEN_SERVICE: (green["image"], green.get("env", {}))}
+    for participant in scenario.get("participants", []):
+        services[participant["name"]] = (participant["image"], participant.get("env", {}))
+    services[CLIENT_SERVICE] = (generate_compose.CLIENT_IMAGE, {})
+
+    digests = {}
+    for image, _ in services.values():
+        if image not in digests:
+            digests[image] = resolve_digest(image)
+
+    identity = {
+        "version": CACHE_VERSION,
+        "scenario": scenario_hash(scenario),
+        "images": {service: digests[image] for service, (image, _) in services.items()},
+        "env": {service: env for service, (_, env) in services.items()},
+    }
+    key = hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()[:32]
+    metadata = {
+        "green_image": green["image"],
+        "green_digest": digests[green["image"]],
+        "images": {service: f"{image_repository(image)}@{digests[image]}" for service, (image, _) in services.items()},
+        "scenario": identity["scenario"],
+    }
+    return key, metadata
+
+
+def load_runs(cache_dir: Path, key: str) -> list[dict[str, Any]]:
+    with locked_index(cache_dir) as index:
+        names = list(index.get(key, {}).get("runs", []))
+    return [json.loads((cache_dir / key / name).read_text()) for name in names]
+
+
+def store_runs(cache_dir: Path, key: str, metadata: dict[str, Any], runs: list[dict[str, Any]],
+               replace: bool = False):
+    entry_dir = cache_dir / key
+    with locked_index(cache_dir) as index:
+        entry = index.get(key)
+        if entry is None or replace:
+            if entry_dir.exists():
+                shutil.rmtree(entry_dir)
+            entry = {**metadata, "created": time.time(), "runs": []}
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        for run in runs:
+            name = f"{uuid.uuid4().hex}.json"
+            atomic_files.write_atomic(entry_dir / name, json.dumps(run, indent=2) + "\n")
+            entry["runs"].append(name)
+        entry["updated"] = time.time()
+        index[key] = entry
+
+
+def remove_entries(cache_dir: Path, predicate: Callable[[str, dict[str, Any]], bool]) -> list[str]:
+    if not (cache_dir / INDEX_PATH).exists():
+        return []
+    with locked_index(cache_dir) as index:
+        removed = [key for key, entry in index.items() if predicate(key, entry)]
+        for key in removed:
+            shutil.rmtree(cache_dir / key, ignore_errors=True)
+            del index[key]
+    return removed
+
+
+def remove_superseded(cache_dir: Path, metadata: dict[str, Any]) -> list[str]:
+    # Same green image reference, different digest: the tag moved and those results are stale
+    return remove_entries(cache_dir, lambda _, entry: entry["green_image"] == metadata["green_image"]
+                          and entry["green_digest"] != metadata["green_digest"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and invalidate cached assessment results")
+    parser.add_argument("--cache", type=Path, default=CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List cached entries")
+
+    key_parser = subparsers.add_parser("key", help="Print the cache key of a scenario")
+    key_parser.add_argument("--scenario", type=Path, default=Path("scenario.toml"))
+
+    invalidate_parser = subparsers.add_parser("invalidate", help="Drop cached entries")
+    target = invalidate_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--green-image", metavar="REF", help="Entries whose green agent is this image (any tag)")
+    target.add_argument("--key", help="One entry")
+    target.add_argument("--all", action="store_true")
+    invalidate_parser.add_argument("--stale", action="store_true",
+                                   help="With --green-image, keep entries whose green digest is REF's current one")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            index = json.loads((args.cache / INDEX_PATH).read_text()) if (args.cache / INDEX_PATH).exists() else {}
+            for key, entry in sorted(index.items(), key=lambda item: item[1]["updated"]):
+                updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["updated"]))
+                print(f"{key}  {len(entry['runs']):>3} run(s)  {updated}  {entry['green_image']}")
+        elif args.command == "key":
+            if not args.scenario.exists():
+                print(f"Error: {args.scenario} not found")
+                sys.exit(1)
+            key, metadata = cache_key(generate_compose.parse_scenario(args.scenario))
+            print(key)
+            for service, image in metadata["images"].items():
+                print(f"  {service:<20}{image}")
+        else:
+            if args.green_image:
+                repository = image_repository(args.green_image)
+                keep = resolve_digest(args.green_image) if args.stale else None
+                removed = remove_entries(args.cache, lambda _, entry: image_repository(entry["green_image"]) == repository
+                                         and entry["green_digest"] != keep)
+            elif args.key:
+                removed = remove_entries(args.cache, lambda key, _: key == args.key)
+            else:
+                removed = remove_entries(args.cache, lambda key, _: True)
+            print(f"Removed {len(removed)} entr{'y' if len(removed) == 1 else 'ies'}")
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
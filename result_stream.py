@@ -0,0 +1,153 @@
+"""Incremental reader for results files that holds one round in memory at a time"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Callable, Iterator, TextIO
+
+
+CHUNK_SIZE = 64 * 1024
+NON_WHITESPACE = re.compile(r'[^ \t\n\r]')
+
+DECODER = json.JSONDecoder()
+
+
+class JsonStream:
+    def __init__(self, f: TextIO, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        # Drops everything already consumed, so the buffer stays around one value in size
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            match = NON_WHITESPACE.search(self.buf, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON document, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+                # A number ending exactly at the buffer end may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_items(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[tuple[str, int | None, Any]]:
+    # Top-level (key, None, value) pairs, except that the "results" array
+    # comes out one (key, round number, round) item at a time
+    stream = JsonStream(f, chunk_size)
+    stream.expect("{")
+    first = True
+    while stream.peek() != "}":
+        if not first:
+            stream.expect(",")
+        first = False
+        key = stream.value()
+        stream.expect(":")
+        if key == "results" and stream.peek() == "[":
+            stream.expect("[")
+            index = 0
+            while stream.peek() != "]":
+                if index:
+                    stream.expect(",")
+                index += 1
+                yield key, index, stream.value()
+            stream.expect("]")
+        else:
+            yield key, None, stream.value()
+    stream.expect("}")
+    try:
+        char = stream.peek()
+    except ValueError:
+        return
+    raise ValueError(f"Unexpected data after JSON document: {char!r}")
+
+
+def iter_rounds(path: Path, last_round: int | None = None) -> Iterator[tuple[int, dict[str, Any]]]:
+    with open(path) as f:
+        for key, index, value in iter_items(f):
+            if key == "results":
+                if last_round is not None and index > last_round:
+                    return
+                yield index, value
+
+
+def read_participants(path: Path) -> dict[str, str]:
+    with open(path) as f:
+        for key, _, value in iter_items(f):
+            if key == "participants":
+                return value
+    return {}
+
+
+def iter_result_records(path: Path, submission: str | None = None, last_round: int | None = None,
+                        visit: Callable[[str, int | None, Any], None] | None = None
+                        ) -> Iterator[tuple[str, str, str | None, int, Any]]:
+    # Same records as leaderboard.result_records. Rounds that precede "participants"
+    # in the file are held back until the agent IDs are known. visit sees every
+    # top-level item (and round) read, for callers that need more than the records
+    submission = Path(path).stem if submission is None else submission
+    participants = None
+    pending = []
+    seen = set()
+
+    with open(path) as f:
+        for key, index, value in iter_items(f):
+            if visit is not None:
+                visit(key, index, value)
+            if key == "participants":
+                participants = value
+                for role, round_no, points in pending:
+                    yield submission, role, participants.get(role), round_no, points
+                pending = []
+            elif key == "results":
+                if last_round is not None and index > last_round:
+                    if participants is not None:
+                        break
+                    continue
+                for role, role_data in value.items():
+                    seen.add(role)
+                    points = role_data.get("points") or 0
+                    if participants is None:
+                        pending.append((role, index, points))
+                    else:
+                        yield submission, role, participants.get(role), index, points
+
+    participants = participants or {}
+    for role, round_no, points in pending:
+        yield submission, role, participants.get(role), round_no, points
+    for role, agent_id in participants.items():
+        if role not in seen:
+            yield submission, role, agent_id, 0, 0
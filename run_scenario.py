@@ -0,0 +1,163 @@
+"""Run a scenario locally, repeated K times in parallel, and merge the rounds into one results file"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import atomic_files
+import generate_compose
+import host_leases
+import result_cache
+
+
+RUNS_DIR = "runs"
+OUTPUT_PATH = "output/results.json"
+ENV_FILE = ".env"
+
+
+def compose(run_dir: Path, env_file: Path | None, *args: str) -> subprocess.CompletedProcess:
+    command = ["docker", "compose"]
+    if env_file:
+        command += ["--env-file", str(env_file.resolve())]
+    return subprocess.run(command + list(args), cwd=run_dir, capture_output=True, text=True)
+
+
+def run_once(scenario: dict[str, Any], run_dir: Path, run_id: str, options: dict[str, Any],
+             env_file: Path | None = None) -> dict[str, Any]:
+    # Each repetition gets its own run ID, port block and compose project
+    try:
+        run_scenario, run_options = generate_compose.prepare_run(scenario, {**options, "run_id": run_id})
+        run_dir.mkdir(parents=True, exist_ok=True)
+        generate_compose.write_artifacts(run_scenario, run_dir, use_cache=False, options=run_options)
+        output_dir = run_dir / "output"
+        output_dir.mkdir(exist_ok=True)
+        output_dir.chmod(0o777)
+        results_path = output_dir / "results.json"
+        results_path.unlink(missing_ok=True)
+
+        up = compose(run_dir, env_file, "up", "--exit-code-from", "agentbeats-client", "--abort-on-container-exit")
+        if up.returncode or not results_path.exists():
+            tail = "\n".join((up.stderr or up.stdout).strip().splitlines()[-5:])
+            raise RuntimeError(f"docker compose up exited with {up.returncode}: {tail}")
+        return json.loads(results_path.read_text())
+    finally:
+        if (run_dir / generate_compose.COMPOSE_PATH).exists():
+            compose(run_dir, env_file, "down", "-v")
+        host_leases.release(run_id)
+
+
+def host_capacity(scenario: dict[str, Any]) -> int:
+    host_cpus = len(host_leases.host_cores())
+    needed = generate_compose.cores_needed(generate_compose.plan_resources(scenario, host_cpus))
+    return max(1, host_cpus // needed)
+
+
+def run_repeats(scenario: dict[str, Any], run_ids: list[str], runs_dir: Path, options: dict[str, Any],
+                jobs: int, env_file: Path | None = None) -> list[tuple[str, dict[str, Any] | None, str | None]]:
+    def run(run_id):
+        try:
+            return run_id, run_once(scenario, runs_dir / run_id, run_id, options, env_file), None
+        except (OSError, ValueError, RuntimeError) as e:
+            return run_id, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(run, run_ids))
+
+
+def merge_results(runs: list[dict[str, Any]]) -> dict[str, Any]:
+    participants = runs[0].get("participants", {})
+    for run in runs[1:]:
+        if run.get("participants", {}) != participants:
+            raise ValueError("Runs disagree on participants, refusing to merge them")
+    return {"participants": participants, "results": [round_data for run in runs for round_data in run.get("results", [])]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a scenario with docker compose, optionally several times")
+    parser.add_argument("--scenario", type=Path, default=Path("scenario.toml"))
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs whose rounds are merged")
+    parser.add_argument("--jobs", type=int, help="Concurrent runs (default: as many as the host's cores fit)")
+    parser.add_argument("--run-id", default=f"run-{time.strftime('%Y%m%d-%H%M%S')}",
+                        help="Prefix of the per-repetition run IDs")
+    parser.add_argument("--runs-dir", type=Path, default=Path(RUNS_DIR), help="Where each run's compose files go")
+    parser.add_argument("--output", type=Path, default=Path(OUTPUT_PATH))
+    parser.add_argument("--env-file", type=Path, default=Path(ENV_FILE), help="Secrets passed to every run")
+    parser.add_argument("--resources", action="store_true",
+                        help="Emit cpus/mem_limit per service, as generate_compose.py --resources does")
+    parser.add_argument("--pin-cpus", action="store_true", help="Lease disjoint host cores for each run")
+    parser.add_argument("--result-cache", type=Path, default=result_cache.CACHE_DIR,
+                        help="Reuse runs of the same images and a2a scenario from this cache")
+    parser.add_argument("--no-result-cache", action="store_true", help="Neither read nor fill the result cache")
+    parser.add_argument("--force", action="store_true", help="Rerun everything and replace the cached runs")
+    args = parser.parse_args()
+
+    if not args.scenario.exists():
+        print(f"Error: {args.scenario} not found")
+        sys.exit(1)
+    if args.repeat < 1:
+        print("Error: --repeat must be at least 1")
+        sys.exit(1)
+
+    scenario = generate_compose.parse_scenario(args.scenario)
+    key = None
+    cached = []
+    if not args.no_result_cache:
+        try:
+            key, metadata = result_cache.cache_key(scenario)
+            result_cache.remove_superseded(args.result_cache, metadata)
+            if not args.force:
+                cached = result_cache.load_runs(args.result_cache, key)[:args.repeat]
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Warning: not using the result cache: {e}")
+            key = None
+    if cached:
+        print(f"Reusing {len(cached)} cached run(s) of {key}")
+
+    # With a partial cache hit only the missing repetitions run
+    options = {"allocate_ports": True, "limit_resources": args.resources, "pin_cpus": args.pin_cpus}
+    run_ids = [f"{args.run_id}-{index}" for index in range(len(cached) + 1, args.repeat + 1)]
+    outcomes = []
+    elapsed = 0.0
+    if run_ids:
+        jobs = min(len(run_ids), args.jobs or host_capacity(scenario))
+        env_file = args.env_file if args.env_file.exists() else None
+        print(f"Running {args.scenario} {len(run_ids)} time(s), {jobs} at a time")
+        start = time.perf_counter()
+        outcomes = run_repeats(scenario, run_ids, args.runs_dir, options, jobs, env_file)
+        elapsed = time.perf_counter() - start
+
+    for run_id, _, error in outcomes:
+        print(f"{'FAILED' if error else 'ok':<7} {run_id}")
+        if error:
+            print(f"        {error}")
+
+    fresh = [result for _, result, error in outcomes if not error]
+    if key and fresh:
+        try:
+            result_cache.store_runs(args.result_cache, key, metadata, fresh, replace=args.force)
+        except OSError as e:
+            print(f"Warning: could not cache the results: {e}")
+
+    runs = cached + fresh
+    if not runs:
+        print("Error: every run failed")
+        sys.exit(1)
+
+    try:
+        merged = merge_results(runs)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    atomic_files.write_atomic(args.output, json.dumps(merged, indent=2) + "\n")
+    print(f"Merged {len(merged['results'])} round(s) from {len(runs)}/{args.repeat} run(s) "
+          f"({len(cached)} cached) into {args.output} in {elapsed:.1f}s")
+    sys.exit(0 if len(runs) == args.repeat else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Round-robin and Swiss tournaments between every agent submitted so far"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any
+
+import atomic_files
+import generate_compose
+import host_leases
+import leaderboard
+import run_scenario
+
+
+SUBMISSIONS_DIR = "submissions"
+TEMPLATE_PATH = "scenario.toml"
+SCHEDULE_PATH = "schedule.json"
+MATCHES_DIR = "matches"
+KINDS = ("round-robin", "swiss")
+
+AGENT_FIELDS = ("agentbeats_id", "image", "env", "resources")
+
+
+def collect_agents(submissions_dir: Path) -> dict[str, dict[str, Any]]:
+    # The most recent submission of an agent decides its image and env
+    tomli = generate_compose.load_tomli()
+    paths = sorted(submissions_dir.glob("*.toml"), key=lambda p: (leaderboard.submission_timestamp(p.stem), p.name))
+    agents = {}
+    for path in paths:
+        try:
+            scenario = tomli.loads(path.read_text())
+        except ValueError as e:
+            print(f"Warning: skipping {path}: {e}", file=sys.stderr)
+            continue
+        for participant in scenario.get("participants", []):
+            if participant.get("agentbeats_id") and participant.get("image"):
+                agents[participant["agentbeats_id"]] = {
+                    field: participant[field] for field in AGENT_FIELDS if field in participant
+                }
+    return agents
+
+
+def template_roles(template: dict[str, Any]) -> list[str]:
+    roles = [p["name"] for p in template.get("participants", [])]
+    if len(roles) != 2:
+        raise ValueError(f"Tournaments need a template with exactly two participant roles, found {len(roles)}")
+    return roles
+
+
+def round_robin(agent_ids: list[str], legs: int = 1) -> list[list[tuple[str, str | None]]]:
+    # Berger tables; None is a bye and takes the fixed seat. Its pair flips every other round and the
+    # others alternate by table, so each agent plays the first role (n-1)/2 times, rounded up or down
+    ring = ([None] if len(agent_ids) % 2 else []) + list(agent_ids)
+    rounds = []
+    for index in range(len(ring) - 1):
+        pairs = []
+        for i in range(len(ring) // 2):
+            first, second = ring[i], ring[-1 - i]
+            if index % 2 if i == 0 else i % 2:
+                first, second = second, first
+            pairs.append((first, second) if first is not None else (second, first))
+        rounds.append(pairs)
+        ring.insert(1, ring.pop())
+    first_leg = list(rounds)
+    for leg in range(1, legs):
+        rounds += [[(b, a) if leg % 2 and b is not None else (a, b) for a, b in pairs] for pairs in first_leg]
+    return rounds
+
+
+def pair_off(standings: list[str], played: set[frozenset], failed: set[tuple[str, ...]]) -> list[tuple[str, str]] | None:
+    # Each agent takes the highest-ranked opponent it has not played that still lets the rest pair off
+    if not standings:
+        return []
+    if tuple(standings) in failed:
+        return None
+    first, rest = standings[0], standings[1:]
+    for opponent in rest:
+        if frozenset((first, opponent)) in played:
+            continue
+        pairs = pair_off([a for a in rest if a != opponent], played, failed)
+        if pairs is not None:
+            return [(first, opponent)] + pairs
+    failed.add(tuple(standings))
+    return None
+
+
+def swiss_round(agent_ids: list[str], scores: dict[str, float], played: set[frozenset],
+                byes: set[str]) -> list[tuple[str, str | None]]:
+    # Pair down the standings without rematches; only when none is possible fall back to greedy pairing
+    standings = sorted(agent_ids, key=lambda agent_id: (-scores.get(agent_id, 0), agent_id))
+    candidates = [None]
+    if len(standings) % 2:
+        candidates = [a for a in reversed(standings) if a not in byes] or [standings[-1]]
+
+    failed = set()
+    for bye in candidates:
+        pairs = pair_off([a for a in standings if a != bye], played, failed)
+        if pairs is not None:
+            break
+    else:
+        bye = candidates[0]
+        remaining = [a for a in standings if a != bye]
+        pairs = []
+        while remaining:
+            first = remaining.pop(0)
+            opponent = next((a for a in remaining if frozenset((first, a)) not in played), remaining[0])
+            remaining.remove(opponent)
+            pairs.append((first, opponent))
+    if bye is not None:
+        pairs.append((bye, None))
+    return pairs
+
+
+def match_scenario(template: dict[str, Any], roles: list[str], agents: dict[str, dict[str, Any]],
+                   pair: tuple[str, str]) -> dict[str, Any]:
+    participants = []
+    for role, agent_id in zip(roles, pair):
+        participants.append({"name": role, **agents[agent_id]})
+    return {**template, "participants": participants}
+
+
+def match_demand(scenario: dict[str, Any], max_cpus: int | None = None) -> dict[str, float]:
+    # On a smaller host a match runs with its services capped and sharing the host's cores
+    plan = generate_compose.plan_resources(scenario, max_cpus)
+    cpus = generate_compose.cores_needed(plan)
+    return {
+        "cpus": cpus if max_cpus is None else min(cpus, max_cpus),
+        "memory_mib": sum(limits["memory_mib"] for limits in plan.values()),
+    }
+
+
+def load_schedule(tournament_dir: Path) -> dict[str, Any]:
+    path = tournament_dir / SCHEDULE_PATH
+    if not path.exists():
+        raise ValueError(f"{path} not found; run tournament.py plan first")
+    return json.loads(path.read_text())
+
+
+def save_schedule(tournament_dir: Path, schedule: dict[str, Any]):
+    atomic_files.write_atomic(tournament_dir / SCHEDULE_PATH, json.dumps(schedule, indent=2) + "\n")
+
+
+def match_results(results_dir: Path, schedule: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    results = {}
+    for path in sorted(results_dir.glob(f"{schedule['name']}-m*.json")):
+        match_id = path.stem[len(schedule["name"]) + 1:].split("-")[0]
+        results[match_id] = json.loads(path.read_text())
+    return results
+
+
+def standings(schedule: dict[str, Any], results: dict[str, dict[str, Any]]) -> dict[str, dict[str, float]]:
+    # Win 1, draw 0.5, loss 0 and a bye counts as a win; points are summed over every round
+    table = {agent_id: {"played": 0, "score": 0.0, "points": 0} for agent_id in schedule["agents"]}
+    roles = schedule["roles"]
+    for match in (match for pairs in schedule["rounds"] for match in pairs):
+        if match["agents"][1] is None:
+            table[match["agents"][0]]["score"] += 1
+            continue
+        result = results.get(match["id"])
+        if result is None:
+            continue
+        totals = []
+        for role, agent_id in zip(roles, match["agents"]):
+            points = sum(round_data.get(role, {}).get("points") or 0 for round_data in result.get("results", []))
+            table[agent_id]["played"] += 1
+            table[agent_id]["points"] += points
+            totals.append(points)
+        for agent_id, mine, theirs in zip(match["agents"], totals, reversed(totals)):
+            table[agent_id]["score"] += 1 if mine > theirs else 0.5 if mine == theirs else 0
+    return table
+
+
+def plan_round(tournament_dir: Path, schedule: dict[str, Any], pairs: list[tuple[str, str | None]],
+               template: dict[str, Any], agents: dict[str, dict[str, Any]]) -> list[dict[str, Any]]:
+    tomli_w = generate_compose.load_tomli_w()
+    matches_dir = tournament_dir / MATCHES_DIR
+    matches_dir.mkdir(parents=True, exist_ok=True)
+
+    matches = []
+    for pair in pairs:
+        match = {"id": f"m{schedule['next_match']:04d}", "agents": list(pair)}
+        schedule["next_match"] += 1
+        if pair[1] is not None:
+            scenario = match_scenario(template, schedule["roles"], agents, pair)
+            match["demand"] = match_demand(scenario)
+            (matches_dir / f"{match['id']}.toml").write_text(tomli_w.dumps(scenario))
+        matches.append(match)
+    schedule["rounds"].append(matches)
+    return matches
+
+
+def cmd_plan(args):
+    template = generate_compose.parse_scenario(args.template)
+    roles = template_roles(template)
+    if (args.dir / SCHEDULE_PATH).exists():
+        schedule = load_schedule(args.dir)
+        if schedule["kind"] != "swiss":
+            raise ValueError(f"{args.dir} already holds a complete {schedule['kind']} schedule")
+    else:
+        name = args.name or f"tournament-{time.strftime('%Y%m%d%H%M%S')}"
+        if not generate_compose.RUN_ID_PATTERN.match(name):
+            raise ValueError(f"Invalid tournament name '{name}': use lowercase letters, digits, '-' and '_'")
+        # Agents keep the image and env they had when the tournament was planned
+        agents = collect_agents(args.submissions)
+        if len(agents) < 2:
+            raise ValueError(f"Need at least two distinct agents in {args.submissions}, found {len(agents)}")
+        schedule = {"name": name, "kind": args.kind, "roles": roles, "agents": agents,
+                    "next_match": 1, "rounds": []}
+
+    agent_ids = sorted(schedule["agents"])
+    if schedule["kind"] == "round-robin":
+        rounds = round_robin(agent_ids, args.legs)
+    else:
+        played = {frozenset(m["agents"]) for pairs in schedule["rounds"] for m in pairs if m["agents"][1]}
+        byes = {m["agents"][0] for pairs in schedule["rounds"] for m in pairs if not m["agents"][1]}
+        if schedule["rounds"]:
+            results = match_results(args.results, schedule)
+            unplayed = [m["id"] for m in schedule["rounds"][-1] if m["agents"][1] and m["id"] not in results]
+            if unplayed:
+                raise ValueError(f"Round {len(schedule['rounds'])} still has unplayed matches: {', '.join(unplayed)}")
+        scores = {a: s["score"] for a, s in standings(schedule, match_results(args.results, schedule)).items()}
+        rounds = [swiss_round(agent_ids, scores, played, byes)]
+
+    planned = [plan_round(args.dir, schedule, pairs, template, schedule["agents"]) for pairs in rounds]
+    save_schedule(args.dir, schedule)
+    matches = sum(1 for pairs in planned for m in pairs if m["agents"][1])
+    print(f"Planned {len(planned)} {schedule['kind']} round(s), {matches} match(es) "
+          f"between {len(agent_ids)} agents in {args.dir}")
+
+
+def host_capacity() -> dict[str, float]:
+    memory_mib = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    return {"cpus": len(host_leases.host_cores()), "memory_mib": memory_mib}
+
+
+def fits(match: dict[str, Any], free: dict[str, float]) -> bool:
+    return all(match["demand"][key] <= free[key] for key in free)
+
+
+def pack(pending: list[dict[str, Any]], free: dict[str, float]) -> list[dict[str, Any]]:
+    # Largest matches first, each started while the host still has room for it
+    placed = []
+    for match in sorted(pending, key=lambda m: (-m["demand"]["cpus"], -m["demand"]["memory_mib"], m["id"])):
+        if fits(match, free):
+            for key in free:
+                free[key] -= match["demand"][key]
+            placed.append(match)
+    return placed
+
+
+def run_matches(matches: list[dict[str, Any]], capacity: dict[str, float], run_match) -> list[tuple[str, str | None]]:
+    free = dict(capacity)
+    for match in matches:
+        if not fits(match, free):
+            raise ValueError(f"Match {match['id']} needs {match['demand']}, more than this host offers ({capacity})")
+
+    pending = list(matches)
+    running = {}
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=max(1, len(matches))) as executor:
+        while pending or running:
+            for match in pack(pending, free):
+                pending.remove(match)
+                running[executor.submit(run_match, match)] = match
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                match = running.pop(future)
+                for key in free:
+                    free[key] += match["demand"][key]
+                outcomes.append((match["id"], future.result()))
+    return outcomes
+
+
+def cmd_run(args):
+    schedule = load_schedule(args.dir)
+    played = match_results(args.results, schedule)
+    matches = [m for pairs in schedule["rounds"] for m in pairs if m["agents"][1] and m["id"] not in played]
+    capacity = host_capacity()
+    for match in matches:
+        scenario = generate_compose.parse_scenario(args.dir / MATCHES_DIR / f"{match['id']}.toml")
+        match["demand"] = match_demand(scenario, capacity["cpus"])
+    env_file = args.env_file if args.env_file.exists() else None
+    options = {"allocate_ports": True, "limit_resources": True}
+    args.results.mkdir(parents=True, exist_ok=True)
+
+    def run_match(match):
+        scenario = generate_compose.parse_scenario(args.dir / MATCHES_DIR / f"{match['id']}.toml")
+        run_id = f"{schedule['name']}-{match['id']}"
+        try:
+            result = run_scenario.run_once(scenario, args.runs_dir / run_id, run_id, options, env_file)
+        except (OSError, ValueError, RuntimeError) as e:
+            return str(e)
+        name = f"{run_id}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}.json"
+        atomic_files.write_atomic(args.results / name, json.dumps(result, indent=2) + "\n")
+        return None
+
+    print(f"Running {len(matches)} match(es) on this host ({capacity['cpus']} cores, {capacity['memory_mib']} MiB)")
+    outcomes = run_matches(matches, capacity, run_match)
+    for match_id, error in sorted(outcomes):
+        print(f"{'FAILED' if error else 'ok':<7} {match_id}")
+        if error:
+            print(f"        {error}")
+    if any(error for _, error in outcomes):
+        sys.exit(1)
+
+
+def cmd_show(args):
+    schedule = load_schedule(args.dir)
+    table = standings(schedule, match_results(args.results, schedule))
+    rows = sorted(((a, s["played"], s["score"], s["points"]) for a, s in table.items()), key=lambda r: (-r[2], -r[3], r[0]))
+    print(leaderboard.format_table(["id", "played", "score", "points"], rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule and run tournaments between submitted agents")
+    parser.add_argument("--results", type=Path, default=Path(leaderboard.RESULTS_DIR))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = subparsers.add_parser("plan", help="Write the pairings (or the next Swiss round) as scenarios")
+    plan_parser.add_argument("dir", type=Path, help="Tournament directory")
+    plan_parser.add_argument("--kind", choices=KINDS, default="round-robin")
+    plan_parser.add_argument("--legs", type=int, default=1, help="Round robin: play each pairing this many times")
+    plan_parser.add_argument("--name", help="Tournament name, used as run ID and results file prefix")
+    plan_parser.add_argument("--template", type=Path, default=Path(TEMPLATE_PATH))
+    plan_parser.add_argument("--submissions", type=Path, default=Path(SUBMISSIONS_DIR))
+    plan_parser.set_defaults(func=cmd_plan)
+
+    run_parser = subparsers.add_parser("run", help="Run every unplayed match, packed onto this host")
+    run_parser.add_argument("dir", type=Path)
+    run_parser.add_argument("--runs-dir", type=Path, default=Path(run_scenario.RUNS_DIR))
+    run_parser.add_argument("--env-file", type=Path, default=Path(run_scenario.ENV_FILE))
+    run_parser.set_defaults(func=cmd_run)
+
+    show_parser = subparsers.add_parser("show", help="Print the standings")
+    show_parser.add_argument("dir", type=Path)
+    show_parser.set_defaults(func=cmd_show)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
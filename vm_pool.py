@@ -0,0 +1,301 @@
+"""Pool of pre-booted CTF VMs that runs restore instead of cold-booting"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+import atomic_files
+import generate_compose
+
+
+POOL_DIR = Path(os.environ.get("CTF_VM_POOL", "/var/tmp/ctf-vm-pool"))
+POOL_STATE_PATH = "pool.json"
+INSTANCE_PATH = "instance.json"
+DISK_NAME = "disk.qcow2"
+STATE_NAME = "state.gz"
+
+# Where the green agent container sees an instance directory
+VM_POOL_MOUNT = "/vm-pool"
+
+SSH_GUEST_PORT = 22
+SSH_WAIT_TIMEOUT = 600
+MIGRATE_TIMEOUT = 300
+
+DRIVE_FILE_PATTERN = re.compile(r'(^|,)file=([^,]+)')
+HOSTFWD_GUEST_PATTERN = re.compile(r'hostfwd=tcp:[^:,]*:(\d+)-[^:,]*:(\d+)')
+
+
+def locked_pool(pool_dir: Path):
+    return atomic_files.locked_json(pool_dir / POOL_STATE_PATH, lambda: {"claims": {}})
+
+
+def vm_signature(vm_command: list[str]) -> str:
+    # Restoring needs the same machine and devices; drive paths and forwarded ports may differ
+    args = []
+    for arg in vm_command:
+        arg = DRIVE_FILE_PATTERN.sub(r'\1file=DRIVE', str(arg))
+        arg = generate_compose.HOSTFWD_PATTERN.sub(r'\1PORT\3', arg)
+        if arg != "-snapshot":
+            args.append(arg)
+    return hashlib.sha256(json.dumps(args).encode()).hexdigest()[:16]
+
+
+def replace_drive(vm_command: list[str], disk_path: str) -> list[str]:
+    rewritten = []
+    for flag, arg in zip([None] + vm_command, vm_command):
+        if flag == "-drive":
+            arg = DRIVE_FILE_PATTERN.sub(lambda m: f"{m.group(1)}file={disk_path}", arg, count=1)
+        rewritten.append(arg)
+    return rewritten
+
+
+def drive_options(vm_command: list[str]) -> dict[str, str]:
+    for flag, arg in zip(vm_command, vm_command[1:]):
+        if flag == "-drive" and DRIVE_FILE_PATTERN.search(arg):
+            return dict(option.partition("=")[::2] for option in arg.split(","))
+    return {}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_ssh(port: int, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=2) as sock:
+                if sock.recv(4).startswith(b"SSH-"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"VM did not answer SSH on port {port} within {timeout}s")
+
+
+class QMP:
+    def __init__(self, path: Path):
+        deadline = time.time() + 30
+        while True:
+            try:
+                self.sock = socket.socket(socket.AF_UNIX)
+                self.sock.connect(str(path))
+                break
+            except OSError:
+                self.sock.close()
+                if time.time() > deadline:
+                    raise RuntimeError(f"QMP socket {path} did not appear")
+                time.sleep(0.1)
+        self.reader = self.sock.makefile("r")
+        self.reader.readline()
+        self.command("qmp_capabilities")
+
+    def command(self, name: str, **arguments) -> Any:
+        self.sock.sendall(json.dumps({"execute": name, "arguments": arguments}).encode() + b"\n")
+        while True:
+            reply = json.loads(self.reader.readline())
+            if "return" in reply:
+                return reply["return"]
+            if "error" in reply:
+                raise RuntimeError(f"QMP {name} failed: {reply['error'].get('desc')}")
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def warm_instance(pool_dir: Path, vm_command: list[str], base_image: Path, guest_base: str) -> Path:
+    instance_id = uuid.uuid4().hex[:12]
+    instance_dir = pool_dir / instance_id
+    instance_dir.mkdir(parents=True)
+    disk = instance_dir / DISK_NAME
+    drive = drive_options(vm_command)
+    base_format = drive.get("format", "qcow2")
+
+    subprocess.run(
+        ["qemu-img", "create", "-q", "-f", "qcow2", "-F", base_format, "-b", str(base_image.resolve()), str(disk)],
+        check=True,
+    )
+
+    # Boot without -snapshot so the saved RAM state matches what is on disk.qcow2
+    args = [arg for arg in replace_drive(vm_command, str(disk)) if arg != "-snapshot"]
+    ssh_port = None
+    for index, arg in enumerate(args):
+        for host_port, guest_port in HOSTFWD_GUEST_PATTERN.findall(arg):
+            port = free_port()
+            arg = arg.replace(f":{host_port}-", f":{port}-", 1)
+            if int(guest_port) == SSH_GUEST_PORT:
+                ssh_port = port
+        args[index] = arg
+    if ssh_port is None:
+        raise RuntimeError("vm_command has no hostfwd to guest port 22, cannot tell when the VM is up")
+
+    qmp_path = instance_dir / "qmp.sock"
+    process = subprocess.Popen(
+        args + ["-qmp", f"unix:{qmp_path},server=on,wait=off", "-display", "none", "-serial", "null", "-monitor", "none"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        start = time.time()
+        wait_for_ssh(ssh_port, SSH_WAIT_TIMEOUT)
+        boot_seconds = time.time() - start
+
+        qmp = QMP(qmp_path)
+        qmp.command("stop")
+        qmp.command("migrate", uri=f"exec:gzip -c > {instance_dir / STATE_NAME}")
+        deadline = time.time() + MIGRATE_TIMEOUT
+        while qmp.command("query-migrate").get("status") != "completed":
+            if time.time() > deadline:
+                raise RuntimeError("Saving the VM state timed out")
+            time.sleep(0.2)
+        qmp.command("quit")
+        qmp.close()
+        process.wait(timeout=30)
+
+        # The overlay was booted against the host copy; inside the green agent the
+        # same base image lives at guest_base
+        if guest_base != str(base_image.resolve()):
+            subprocess.run(["qemu-img", "rebase", "-u", "-F", base_format, "-b", guest_base, str(disk)], check=True)
+    except BaseException:
+        process.kill()
+        shutil.rmtree(instance_dir, ignore_errors=True)
+        raise
+    finally:
+        qmp_path.unlink(missing_ok=True)
+
+    instance = {
+        "id": instance_id,
+        "signature": vm_signature(vm_command),
+        "base_image": str(base_image.resolve()),
+        "qemu": vm_command[0],
+        "boot_seconds": round(boot_seconds, 1),
+        "created": int(time.time()),
+    }
+    (instance_dir / INSTANCE_PATH).write_text(json.dumps(instance, indent=2) + "\n")
+    return instance_dir
+
+
+def list_instances(pool_dir: Path) -> list[dict[str, Any]]:
+    instances = []
+    for path in sorted(pool_dir.glob(f"*/{INSTANCE_PATH}")):
+        instance = json.loads(path.read_text())
+        instance["path"] = str(path.parent)
+        instances.append(instance)
+    return instances
+
+
+def claim_instance(pool_dir: Path, run_id: str, vm_command: list[str]) -> Path:
+    # Runs restore with -snapshot, so one instance can back several runs; spread claims anyway
+    signature = vm_signature(vm_command)
+    with locked_pool(pool_dir) as state:
+        claims = state["claims"]
+        if run_id in claims:
+            return pool_dir / claims[run_id]
+
+        candidates = [i for i in list_instances(pool_dir) if i["signature"] == signature]
+        if not candidates:
+            raise RuntimeError(f"No pooled instance matches this vm_command (signature {signature}); run vm_pool.py warm")
+        load = {i["id"]: 0 for i in candidates}
+        for instance_id in claims.values():
+            if instance_id in load:
+                load[instance_id] += 1
+        chosen = min(candidates, key=lambda i: (load[i["id"]], i["id"]))
+        claims[run_id] = chosen["id"]
+        return pool_dir / chosen["id"]
+
+
+def release_instance(pool_dir: Path, run_id: str) -> bool:
+    with locked_pool(pool_dir) as state:
+        return state["claims"].pop(run_id, None) is not None
+
+
+def pooled_vm_command(vm_command: list[str], mount: str = VM_POOL_MOUNT) -> list[str]:
+    args = replace_drive(vm_command, f"{mount}/{DISK_NAME}")
+    if "-snapshot" not in args:
+        args.append("-snapshot")
+    return args + ["-incoming", f"exec:gzip -dc {mount}/{STATE_NAME}"]
+
+
+def load_vm_command(scenario_path: Path) -> list[str]:
+    scenario = generate_compose.parse_scenario(scenario_path)
+    vm_command = [str(arg) for arg in scenario.get("config", {}).get("vm_command", [])]
+    if not vm_command:
+        raise RuntimeError(f"{scenario_path} has no [config].vm_command")
+    return vm_command
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage pre-booted VM snapshots for CTF scenarios")
+    parser.add_argument("--pool", type=Path, default=POOL_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    warm_parser = subparsers.add_parser("warm", help="Boot VMs from a scenario's vm_command and save them booted")
+    warm_parser.add_argument("--scenario", type=Path, required=True)
+    warm_parser.add_argument("--base-image", type=Path, help="Host path of the VM image (default: the -drive file)")
+    warm_parser.add_argument("--guest-base",
+                             help="Absolute path of the VM image inside the green agent image (default: the -drive file)")
+    warm_parser.add_argument("--count", type=int, default=1)
+
+    claim_parser = subparsers.add_parser("claim", help="Claim an instance for a run and print its directory")
+    claim_parser.add_argument("--scenario", type=Path, required=True)
+    claim_parser.add_argument("--run-id", required=True)
+
+    release_parser = subparsers.add_parser("release", help="Release a run's claim")
+    release_parser.add_argument("--run-id", required=True)
+
+    remove_parser = subparsers.add_parser("remove", help="Delete an unclaimed instance")
+    remove_parser.add_argument("instance_id")
+
+    subparsers.add_parser("list", help="List pooled instances and claims")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "warm":
+            vm_command = load_vm_command(args.scenario)
+            drive_file = drive_options(vm_command).get("file", "")
+            base_image = args.base_image or Path(drive_file)
+            if not base_image.is_file():
+                raise RuntimeError(f"Base image {base_image} not found; pass --base-image")
+            guest_base = args.guest_base or drive_file
+            if not guest_base.startswith("/"):
+                raise RuntimeError(f"-drive file {drive_file} is relative; pass --guest-base with its absolute path")
+            for _ in range(args.count):
+                instance_dir = warm_instance(args.pool, vm_command, base_image, guest_base)
+                print(f"Warmed {instance_dir}")
+        elif args.command == "claim":
+            print(claim_instance(args.pool, args.run_id, load_vm_command(args.scenario)))
+        elif args.command == "release":
+            if not release_instance(args.pool, args.run_id):
+                raise RuntimeError(f"{args.run_id} holds no claim")
+            print(f"Released claim of {args.run_id}")
+        elif args.command == "remove":
+            with locked_pool(args.pool) as state:
+                if args.instance_id in state["claims"].values():
+                    raise RuntimeError(f"{args.instance_id} is claimed")
+                shutil.rmtree(args.pool / args.instance_id)
+            print(f"Removed {args.instance_id}")
+        else:
+            with locked_pool(args.pool) as state:
+                claims = state["claims"]
+            for instance in list_instances(args.pool):
+                runs = sorted(run_id for run_id, instance_id in claims.items() if instance_id == instance["id"])
+                print(f"{instance['id']}  signature {instance['signature']}  booted in {instance['boot_seconds']}s  "
+                      f"claims: {', '.join(runs) or 'none'}")
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()